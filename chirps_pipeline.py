@@ -37,27 +37,113 @@ Usage:
     # Option 2: Use GEE boundaries with a date range
     python3 chirps_pipeline.py --use-gee-boundaries --country-name "Kenya" --admin-level 2 --admin-names "Nairobi,Mombasa" --start-date "2020-01-01" --end-date "2023-01-01"
 
+    # Several countries at once (GAUL boundaries are downloaded in parallel pages)
+    python3 chirps_pipeline.py --use-gee-boundaries --country-name "Kenya,Uganda,United Republic of Tanzania" --admin-level 2
+
     # Option 3: Use a local shapefile
     python3 chirps_pipeline.py --shapefile path/to/shapefile.shp --admin-field ADM2_NAME --admin-names "Area1,Area2"
 
     # With all optional parameters
     python3 chirps_pipeline.py --use-gee-boundaries --country-name "Madagascar" --admin-level 2 --output-dir ./output --start-date "2015-01-01" --end-date "2025-01-01" --early-first 31 --early-last 39 --late-first 40 --late-last 48
 
+    # Daily product (streamed, aggregated on the fly to pentads/dekads + rain days and dry spells)
+    python3 chirps_pipeline.py --use-gee-boundaries --country-name "Kenya" --admin-level 2 --product daily --start-date "2020-01-01"
+
+    # Extra statistics in the same pass (one output column each)
+    python3 chirps_pipeline.py --use-gee-boundaries --country-name "Kenya" --admin-level 2 --stats "max,stdDev,count"
+
+    # Keep outputs current: poll for new pentads and fetch only the new months for every job
+    python3 chirps_pipeline.py --serve-refresh --jobs jobs.json --poll-minutes 360
+
+    # Per-district bundles for the static site (lazy-loaded via manifest.json)
+    python3 chirps_pipeline.py --use-gee-boundaries --country-name "Kenya" --admin-level 2 --bundle-dir ./public/data/kenya
+
+    # Analysis-ready (gid, pentad) arrays alongside the CSVs
+    python3 chirps_pipeline.py --shapefile path/to/shapefile.shp --array-dir ./output/arrays
+
+    # Query service over finished outputs: GET /series?gid=..&agg=dekad&from=2020-01-01&to=2020-12-31
+    python3 chirps_pipeline.py --serve-series --series-dirs ./output/kenya,./output/uganda --port 8765
+
+    # Dry run: predict records, response size, requests and wall time, and pick a download strategy
+    python3 chirps_pipeline.py --shapefile path/to/shapefile.shp --start-date "2000-01-01" --end-date "2025-01-01" --plan
+
+    # Local reduction over a CHIRPS cube built from CHC GeoTIFFs, sharded across all cores
+    python3 chirps_pipeline.py --shapefile kenya_adm2.shp --build-cube "tifs/chirps-v2.0.*.tif" --local-cube kenya.npy --cube-bbox "33,-5,42,5"
+
+    # Station time series: each point gets the CHIRPS cell containing it (same CSV schema)
+    python3 chirps_pipeline.py --points stations.csv --point-id-field station_id --start-date "2020-01-01"
+
+    # Earth Engine results are cached on disk (default ~/.cache/desdr-chirps), so re-runs with the
+    # same boundaries and dates cost no GEE compute. Bypass with --no-cache.
+
 Output:
     - chirps_raw.csv  : Pentad rainfall data with full DESDR schema (system:index, ADM0-2, mean, etc.)
     - admin_raw.csv   : Admin area defaults with dekad season ranges
+    - chirps_dekadal.csv : Dekad totals per gid (plus rain_days and max_dry_spell for --product daily)
+    - refresh_state.json : (--serve-refresh) Last refresh time and newest image per job
+    - dry_spells.json : (--product daily) Dry spell running into the last month starts, so refreshes continue it
+    - <bundle-dir>/manifest.json + one <gid>.json.gz/.json.br/.f32 per district (--bundle-dir)
+    - <array-dir>/index.json + mean (zarr) or mean.npy : (gid, pentad) rainfall arrays (--array-dir)
+    - run_report.json : Request counts, bytes and timings (also appended to the run history for --plan)
 """
 
 import ee
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 import argparse
+import glob
+import gzip
+import hashlib
 import os
 import json
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from typing import List, Optional, Tuple
-from shapely.geometry import shape
+from typing import List, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlparse
+import shapely
+
+
+# CHIRPS products available on Earth Engine
+CHIRPS_COLLECTIONS = {
+    'pentad': "UCSB-CHG/CHIRPS/PENTAD",
+    'daily': "UCSB-CHG/CHIRPS/DAILY",
+}
+
+# CHIRPS grid resolution (0.05 degrees, ~5.5 km at the equator)
+CHIRPS_PIXEL_DEGREES = 0.05
+
+# Global CHIRPS grid (50°S-50°N): top-left (x0, dx, y0, dy) and (rows, cols)
+CHIRPS_GRID_TRANSFORM = (-180.0, CHIRPS_PIXEL_DEGREES, 50.0, -CHIRPS_PIXEL_DEGREES)
+CHIRPS_GRID_SHAPE = (2000, 7200)
+CHIRPS_CRS_TRANSFORM = [CHIRPS_GRID_TRANSFORM[1], 0, CHIRPS_GRID_TRANSFORM[0], 0, CHIRPS_GRID_TRANSFORM[3], CHIRPS_GRID_TRANSFORM[2]]
+
+# Per-polygon statistics available through --stats (output column = name).
+# 'mean' is always computed because pentad/dekad totals are built from it. The
+# other stats are taken over the native 0.05° CHIRPS pixels whose centres fall
+# inside the polygon (count = number of such pixels with data), so polygons with
+# no pixel centre get count 0 and no min/max/stdDev.
+STAT_REDUCERS = {
+    'mean': lambda: ee.Reducer.mean(),
+    'min': lambda: ee.Reducer.min(),
+    'max': lambda: ee.Reducer.max(),
+    'stdDev': lambda: ee.Reducer.stdDev(),
+    'count': lambda: ee.Reducer.count()
+}
 
+DEFAULT_CACHE_DIR = os.path.join(Path.home(), '.cache', 'desdr-chirps')
+DEFAULT_RUN_HISTORY = os.path.join(DEFAULT_CACHE_DIR, 'run_history.jsonl')
+
+# Planner defaults, used until past run reports are available for calibration
+GETINFO_MAX_BYTES = 10 * 1024 * 1024  # Earth Engine rejects larger getInfo() responses
+DEFAULT_SECONDS_PER_RECORD = 0.002
+DEFAULT_SECONDS_PER_REQUEST = 2.0
 
 def initialize_earth_engine():
     """
@@ -73,27 +159,190 @@ def initialize_earth_engine():
         raise
 
 
+class QueryCache:
+    """
+    Content-addressed on-disk cache of Earth Engine getInfo() results.
+    
+    Entries are keyed by a SHA-256 hash of the serialized Earth Engine expression (plus
+    any extra context such as the dataset's latest image date), so identical queries are
+    served from disk instead of being recomputed remotely.
+    
+    - Size-bounded: least-recently-used entries are evicted once max_size_mb is exceeded.
+    - Queries touching the last tail_days of the collection (where CHIRPS preliminary
+      data is still being replaced) expire after ttl_hours; older data never expires.
+    - Safe to share between concurrent processes: entries are swapped in atomically and
+      files removed by another process's eviction are treated as misses.
+    """
+    
+    # Puts between full directory scans; other processes' writes are only seen by a scan
+    RESCAN_EVERY = 256
+    
+    def __init__(
+        self,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        max_size_mb: float = 2048,
+        ttl_hours: float = 24,
+        tail_days: int = 60
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.ttl_seconds = ttl_hours * 3600
+        self.tail_days = tail_days
+        self.hits = 0
+        self.misses = 0
+        self._size_bytes = None  # Estimated total size, refreshed by _scan()
+        self._puts_since_scan = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+    
+    def key_for(self, ee_object, extra: Optional[dict] = None) -> str:
+        """Hash the serialized Earth Engine expression (and extra context) into a cache key."""
+        digest = hashlib.sha256(ee_object.serialize().encode('utf-8'))
+        if extra:
+            digest.update(json.dumps(extra, sort_keys=True, default=str).encode('utf-8'))
+        return digest.hexdigest()
+    
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json.gz"
+    
+    def _is_volatile(self, end_date: Optional[str]) -> bool:
+        """Queries without an end date, or ending inside the still-updating tail, may change."""
+        if end_date is None:
+            return True
+        tail_start = pd.Timestamp.now().normalize() - pd.Timedelta(days=self.tail_days)
+        return pd.Timestamp(end_date) > tail_start
+    
+    def get(self, key: str):
+        """Return the cached value for key, or None if missing or expired."""
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        
+        if entry['expires'] is not None and entry['expires'] < time.time():
+            path.unlink(missing_ok=True)
+            return None
+        
+        # Bump mtime so eviction sees this entry as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # Evicted by another process since we read it
+        return entry['value']
+    
+    def put(self, key: str, value, volatile: bool = False) -> None:
+        """Store a JSON-serializable value, then evict old entries if over the size limit."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {
+            'created': time.time(),
+            'expires': time.time() + self.ttl_seconds if volatile else None,
+            'value': value
+        }
+        
+        # Write to a temp file first so concurrent jobs never read a partial entry
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(entry, f)
+        size = tmp_path.stat().st_size
+        os.replace(tmp_path, path)
+        
+        # Only scan the directory when our running estimate passes the limit, or every
+        # RESCAN_EVERY puts to pick up what other processes have written
+        if self._size_bytes is None:
+            self._scan()
+        else:
+            self._size_bytes += size
+            self._puts_since_scan += 1
+        if self._size_bytes > self.max_size_bytes or self._puts_since_scan >= self.RESCAN_EVERY:
+            self._evict()
+    
+    def _scan(self) -> list:
+        """(mtime, size, path) of every entry, skipping files removed while scanning."""
+        entries = []
+        for path in self.cache_dir.glob('*/*.json.gz'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        self._size_bytes = sum(size for _, size, _ in entries)
+        self._puts_since_scan = 0
+        return entries
+    
+    def _evict(self) -> None:
+        entries = self._scan()
+        total = self._size_bytes
+        if total <= self.max_size_bytes:
+            return
+        
+        for _, size, path in sorted(entries):
+            path.unlink(missing_ok=True)
+            total -= size
+            if total <= self.max_size_bytes:
+                break
+        self._size_bytes = total
+    
+    def get_info(self, ee_object, end_date: Optional[str] = None, extra: Optional[dict] = None):
+        """
+        Cached equivalent of ee_object.getInfo().
+        
+        Args:
+            ee_object: Earth Engine object to evaluate
+            end_date: Last date the query covers (None = open-ended), used to decide expiry
+            extra: Additional context that changes the result but not the expression
+        """
+        key = self.key_for(ee_object, extra)
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        
+        self.misses += 1
+        value = ee_object.getInfo()
+        self.put(key, value, volatile=self._is_volatile(end_date))
+        return value
+
+
+def _get_info(ee_object, cache: Optional[QueryCache] = None, end_date: Optional[str] = None, extra: Optional[dict] = None):
+    """Evaluate an Earth Engine object, going through the query cache when one is given."""
+    if cache is None:
+        return ee_object.getInfo()
+    return cache.get_info(ee_object, end_date=end_date, extra=extra)
+
+
 def load_admin_boundaries_from_gee(
-    country_name: str,
+    country_name: Union[str, List[str]],
     admin_level: int = 2,
-    admin_names: Optional[List[str]] = None
-) -> pd.DataFrame:
+    admin_names: Optional[List[str]] = None,
+    page_size: int = 250,
+    max_workers: int = 8
+) -> gpd.GeoDataFrame:
     """
     Load admin boundaries directly from Google Earth Engine (GAUL dataset).
     
     This matches the approach in the paper - using GEE's built-in admin boundaries
     instead of requiring a local shapefile.
     
+    The filtered collection is downloaded in pages of page_size features, several pages
+    at a time, so large collections (e.g. every district of a region) stay below Earth
+    Engine's element and payload limits. A page that still hits a size limit is split
+    in half; any other error is raised straight away.
+    
     Args:
-        country_name: Country name (e.g., "Madagascar")
+        country_name: Country name (e.g., "Madagascar") or a list of country names
         admin_level: Administrative level (0=country, 1=province, 2=district)
         admin_names: Optional list of specific admin area names to filter
+        page_size: Features per getInfo() request
+        max_workers: Pages requested concurrently
     
     Returns:
         GeoDataFrame with admin boundaries and attributes
     """
+    country_names = [country_name] if isinstance(country_name, str) else list(country_name)
     print(f"\n📥 Loading admin boundaries from Google Earth Engine...")
-    print(f"   Country: {country_name}")
+    print(f"   Country: {', '.join(country_names)}")
     print(f"   Admin level: {admin_level}")
     
     # Load GAUL dataset from Earth Engine
@@ -103,15 +352,11 @@ def load_admin_boundaries_from_gee(
     print(f"   Loading dataset: {gaul_dataset}")
     gaul = ee.FeatureCollection(gaul_dataset)
     
-    # Filter to country
-    country_filtered = gaul.filter(ee.Filter.eq('ADM0_NAME', country_name))
-    
-    # Get count
-    count = country_filtered.size().getInfo()
-    print(f"   Found {count} admin areas in {country_name}")
-    
-    if count == 0:
-        raise ValueError(f"No admin areas found for country: {country_name}")
+    # Filter to countries
+    if len(country_names) == 1:
+        country_filtered = gaul.filter(ee.Filter.eq('ADM0_NAME', country_names[0]))
+    else:
+        country_filtered = gaul.filter(ee.Filter.inList('ADM0_NAME', country_names))
     
     # Filter to specific admin names if provided
     if admin_names:
@@ -119,65 +364,58 @@ def load_admin_boundaries_from_gee(
         country_filtered = country_filtered.filter(
             ee.Filter.inList(admin_field, admin_names)
         )
-        filtered_count = country_filtered.size().getInfo()
-        print(f"   Filtered to {filtered_count} specified areas: {admin_names}")
     
-    # Download to Python
-    print("   Downloading boundaries from Earth Engine...")
-    features_list = country_filtered.getInfo()['features']
+    # Get count
+    count = country_filtered.size().getInfo()
+    if admin_names:
+        print(f"   Found {count} of the specified areas: {admin_names}")
+    else:
+        print(f"   Found {count} admin areas in {', '.join(country_names)}")
     
-    # Convert to GeoDataFrame
-    data_records = []
-    for feature in features_list:
-        props = feature['properties']
-        geom = feature.get('geometry')
-        
-        record = dict(props)
-        if geom:
-            record['geometry'] = geom
-        
-        data_records.append(record)
+    if count == 0:
+        raise ValueError(f"No admin areas found for country: {', '.join(country_names)}")
+    
+    # Download to Python, a few pages at a time
+    offsets = range(0, count, page_size)
+    print(f"   Downloading boundaries from Earth Engine ({len(offsets)} page(s) of up to {page_size} features)...")
     
-    # Create GeoDataFrame
-    geometries = []
-    properties = []
+    def fetch_page(offset: int, size: int) -> list:
+        page = ee.FeatureCollection(country_filtered.toList(size, offset))
+        try:
+            return page.getInfo()['features']
+        except ee.EEException as e:
+            # Auth, quota or filter errors would fail for every half too
+            if size == 1 or not _is_size_error(e):
+                raise
+            half = size // 2
+            return fetch_page(offset, half) + fetch_page(offset + half, size - half)
     
-    for record in data_records:
-        if 'geometry' in record:
-            geom = record.pop('geometry')
-            geometries.append(shape(geom))
-            properties.append(record)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pages = list(executor.map(lambda offset: fetch_page(offset, min(page_size, count - offset)), offsets))
     
-    gdf = gpd.GeoDataFrame(properties, geometry=geometries, crs='EPSG:4326')
+    features = [feature for page in pages for feature in page if feature.get('geometry')]
+    gdf = gpd.GeoDataFrame.from_features(features, crs='EPSG:4326')
     
     print(f"   ✓ Loaded {len(gdf)} admin boundaries")
     
     return gdf
 
 
-def download_chirps_data(
+def prepare_admin_boundaries(
     shapefile_path: Optional[str] = None,
-    country_name: Optional[str] = None,
+    country_name: Optional[Union[str, List[str]]] = None,
     admin_level: int = 2,
     admin_field: str = "ADM2_NAME",
     admin_names: Optional[List[str]] = None,
     country_filter: Optional[str] = None,
-    use_gee_boundaries: bool = False,
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None
-) -> pd.DataFrame:
+    use_gee_boundaries: bool = False
+) -> Tuple[gpd.GeoDataFrame, str, str]:
     """
-    Download CHIRPS pentad (5-day) data from Google Earth Engine.
-    
-    This function replicates the JavaScript Earth Engine script functionality:
-    - Loads CHIRPS PENTAD dataset
-    - Filters to specified admin areas (from shapefile OR GEE)
-    - Calculates spatial average rainfall for each area
-    - Returns as pandas DataFrame
+    Load admin boundaries (from shapefile OR GEE) and fill in the DESDR admin fields.
     
     Args:
         shapefile_path: Path to shapefile (optional if use_gee_boundaries=True)
-        country_name: Country name for GEE boundaries (required if use_gee_boundaries=True)
+        country_name: Country name (or list of names) for GEE boundaries (required if use_gee_boundaries=True)
         admin_level: Admin level for GEE (0=country, 1=province, 2=district)
         admin_field: Field name in shapefile that contains admin area names (default: "ADM2_NAME")
         admin_names: Optional list of specific admin area names to filter
@@ -185,7 +423,7 @@ def download_chirps_data(
         use_gee_boundaries: If True, load boundaries from GEE instead of shapefile
     
     Returns:
-        DataFrame with columns: [admin_field, admin_code_field, 'system:time_start', 'mean', 'id']
+        Tuple of (GeoDataFrame in EPSG:4326, admin_field, admin_code_field)
     """
     # Load admin boundaries
     if use_gee_boundaries:
@@ -246,7 +484,7 @@ def download_chirps_data(
         print(f"   Using admin field: {admin_field}")
         print(f"   Using admin code field: {admin_code_field}")
     
-    # Convert GeoDataFrame to Earth Engine FeatureCollection
+    # Normalize the GeoDataFrame to the DESDR schema before it goes to Earth Engine
     print("\n Step 2: Converting shapefile to Earth Engine format...")
     
     # Ensure CRS is WGS84 for Earth Engine
@@ -260,6 +498,13 @@ def download_chirps_data(
         gdf['Shape_Area'] = gdf.geometry.area
         gdf['Shape_Leng'] = gdf.geometry.length
     
+    _fill_desdr_fields(gdf, admin_field, admin_code_field)
+    
+    return gdf, admin_field, admin_code_field
+
+
+def _fill_desdr_fields(gdf: gpd.GeoDataFrame, admin_field: str, admin_code_field: str) -> gpd.GeoDataFrame:
+    """Add the ADM0-2 and default DESDR fields that are missing from gdf (in place)."""
     # Ensure admin level fields exist (for DESDR format)
     admin_level_fields = {
         'ADM0_CODE': ['ADM0_CODE', 'GID_0', 'ISO_A3'],
@@ -293,247 +538,219 @@ def download_chirps_data(
     if 'STR2_YEAR' not in gdf.columns:
         gdf['STR2_YEAR'] = 2007
     
-    geojson = gdf.to_json()
-    ee_features = ee.FeatureCollection(json.loads(geojson))
-    
-    print(f"   Created FeatureCollection with {ee_features.size().getInfo()} features")
-    print(f"   Preserved admin fields: ADM0, ADM1, ADM2")
-    
-    # Load CHIRPS dataset
-    print("\n Step 3: Loading CHIRPS PENTAD dataset from Earth Engine...")
-    dataset = ee.ImageCollection("UCSB-CHG/CHIRPS/PENTAD").select('precipitation')
-    
-    # Apply date filter if provided
-    if start_date:
-        dataset = dataset.filterDate(start_date, end_date or '2099-12-31')
-        print(f"   Date filter: {start_date} to {end_date or 'present'}")
-    
-    # Get date range info
-    first_image = ee.Image(dataset.first())
-    last_image = ee.Image(dataset.sort('system:time_start', False).first())
-    
-    actual_start = ee.Date(first_image.get('system:time_start')).format('YYYY-MM-dd').getInfo()
-    actual_end = ee.Date(last_image.get('system:time_start')).format('YYYY-MM-dd').getInfo()
-    image_count = dataset.size().getInfo()
-    
-    print(f"   CHIRPS data range: {actual_start} to {actual_end} ({image_count} images)")
-    
-    # Calculate areal mean for each feature and each image
-    print("\n Step 4: Calculating spatial averages (this may take several minutes)...")
-    
-    def calculate_areal_mean(image):
-        """Calculate mean precipitation for each feature in the collection."""
-        # Get image date for system:index
-        image_date = ee.Date(image.get('system:time_start'))
-        
-        reduced = image.reduceRegions(
-            collection=ee_features,
-            reducer=ee.Reducer.mean(),
-            scale=10000  # 10km scale as in original script
-        )
-        
-        # Process each feature to add image properties and preserve all admin fields
-        def process_feature(feature):
-            # Create system:index from date and feature id
-            date_str = image_date.format('YYYYMMdd')
-            feature_id = feature.id()
-            system_index = ee.String(date_str).cat('_').cat(feature_id)
-            
-            # Preserve all original properties and add image properties
-            return feature.setGeometry(None)\
-                .copyProperties(image, ['system:time_start'])\
-                .set('id', feature_id)\
-                .set('system:index', system_index)\
-                .set('mean', feature.get('mean'))
-        
-        return reduced.map(process_feature)
-    
-    # Map over all images
-    areal_means = dataset.map(calculate_areal_mean)
-    
-    # Flatten the collection
-    final_collection = areal_means.flatten()
-    
-    # Check collection size to decide download method
-    print("\n Checking data size...")
-    try:
-        collection_size = final_collection.size().getInfo()
-        print(f"   Total records: {collection_size:,}")
-        
-        # Estimate size (rough: ~1.5KB per feature)
-        estimated_size_mb = (collection_size * 1.5) / 1024
-        print(f"   Estimated size: ~{estimated_size_mb:.1f} MB")
-        
-        # Use export method for large datasets (>50MB to be safe)
-        if estimated_size_mb > 50:
-            print("   ⚠️  Dataset is large - using export method (more reliable)")
-            print("   Note: This will export to Google Drive - you'll need to download manually")
-            print("   See GEE_DOWNLOAD_GUIDE.md for instructions")
-            df = _download_via_export(final_collection, admin_field, admin_code_field)
-        else:
-            print("   ✓ Dataset size OK - using direct download")
-            df = _download_via_getinfo(final_collection, admin_field, admin_code_field)
-            
-    except Exception as e:
-        print(f"   ⚠️  Could not estimate size: {e}")
-        print("   Attempting direct download (may fail for large datasets)...")
-        df = _download_via_getinfo(final_collection, admin_field, admin_code_field)
-    
-    print(f"   ✓ Downloaded {len(df)} records")
-    if len(df) > 0:
-        print(f"   ✓ Date range: {df['system:time_start'].min()} to {df['system:time_start'].max()}")
-    
-    return df, admin_field, admin_code_field
+    return gdf
+
+
+def _gdf_to_ee_features(gdf: gpd.GeoDataFrame) -> ee.FeatureCollection:
+    """Upload a GeoDataFrame as an Earth Engine FeatureCollection (feature ids are the gdf index)."""
+    return ee.FeatureCollection(json.loads(gdf.to_json()))
 
 
-def _download_via_getinfo(collection, admin_field, admin_code_field):
+class ZonalReduction:
     """
-    Download data using .getInfo() - works for small datasets.
-    
-    This method directly downloads data from Earth Engine to Python.
-    Limited to ~10MB responses.
-    
-    Preserves all columns from Earth Engine export to match DESDR format.
+    Adaptive reduceRegions parameters for a set of admin boundaries.
+    
+    - Polygons smaller than a few CHIRPS pixels are reduced at a fine scale, so the
+      (pixel-fraction weighted) mean always sees the pixels they overlap instead of
+      returning null when no 10 km pixel centre falls inside them.
+    - All other polygons use the original 10 km scale.
+    - tileScale starts at 1 and is raised by _fetch_records whenever Earth Engine runs
+      out of memory; the raised value is kept for the rest of the run.
+    - With page_size, features are split into pages that are requested separately, so
+      even a single image over many thousands of features stays under the element limit.
+    - Extra stats (min, max, stdDev, count) are computed with one combined, unweighted
+      reducer on the native CHIRPS grid, so they describe real 0.05° pixels whatever
+      scale the mean used; both reductions go out in the same request.
     """
-    print("   Downloading data directly from Earth Engine...")
-    print("   (This may take a few minutes)")
     
-    try:
-        # Get all features as a list
-        features_list = collection.getInfo()['features']
-        
-        # Convert to list of dictionaries - preserve ALL properties
-        data_records = []
-        for feature in features_list:
-            props = feature['properties']
-            
-            # Create record with all properties (preserve full format)
-            record = dict(props)  # Start with all properties
-            
-            # Ensure key fields exist
-            if 'system:time_start' not in record:
-                record['system:time_start'] = props.get('system:time_start')
-            if 'mean' not in record:
-                record['mean'] = props.get('mean')
-            if 'id' not in record:
-                record['id'] = props.get('id')
-            
-            # Add geometry if present (as GeoJSON string)
-            if 'geometry' in feature:
-                import json
-                record['.geo'] = json.dumps(feature['geometry'])
-            
-            data_records.append(record)
+    def __init__(
+        self,
+        gdf: gpd.GeoDataFrame,
+        scale: float = 10000,
+        small_polygon_pixels: float = 4,
+        small_polygon_scale: float = 1000,
+        max_tile_scale: int = 16,
+        page_size: Optional[int] = None,
+        stats: Optional[List[str]] = None
+    ):
+        self.stats = _normalize_stats(stats)
+        self.feature_count = len(gdf)
+        self.page_feature_count = min(page_size or len(gdf), len(gdf))
+        self.scale = scale
+        self.small_polygon_scale = small_polygon_scale
+        self.max_tile_scale = max_tile_scale
+        self.tile_scale = 1
         
-        df = pd.DataFrame(data_records)
+        # gdf is in EPSG:4326, so areas are in square degrees like the CHIRPS grid
+        small = shapely.area(gdf.geometry.to_numpy()) < small_polygon_pixels * CHIRPS_PIXEL_DEGREES ** 2
+        self.small_count = int(small.sum())
         
-        # Ensure system:index is created if not present
-        if 'system:index' not in df.columns and 'system:time_start' in df.columns:
-            # Create system:index from date and id
-            df['date_str'] = pd.to_datetime(df['system:time_start'], unit='ms').dt.strftime('%Y%m%d')
-            df['id_str'] = df['id'].astype(str).str.zfill(24)  # Pad to 24 chars with zeros
-            df['system:index'] = df['date_str'] + '_' + df['id_str']
-            df = df.drop(columns=['date_str', 'id_str'])
-        
-        return df
+        self.pages = []
+        for page_start in range(0, len(gdf), max(self.page_feature_count, 1)):
+            page = slice(page_start, page_start + self.page_feature_count)
+            page_gdf, page_small = gdf.iloc[page], small[page]
+            groups = []
+            if page_small.any():
+                groups.append((_gdf_to_ee_features(page_gdf[page_small]), small_polygon_scale))
+            if not page_small.all():
+                groups.append((_gdf_to_ee_features(page_gdf[~page_small]), scale))
+            self.pages.append(groups)
+    
+    @property
+    def record_columns(self) -> List[str]:
+        return ['id', 'system:time_start'] + self.stats
+    
+    @staticmethod
+    def reducer(stats: List[str]) -> ee.Reducer:
+        """Single combined reducer for stats (outputs are named after the stats)."""
+        reducer = STAT_REDUCERS[stats[0]]()
+        for stat in stats[1:]:
+            reducer = reducer.combine(STAT_REDUCERS[stat](), sharedInputs=True)
+        return reducer
+    
+    def reduce(self, image: ee.Image, page: int = 0) -> ee.FeatureCollection:
+        """Reduce one CHIRPS image over the admin features of a page (adds one property per stat)."""
+        reduced = [
+            image.reduceRegions(
+                collection=features,
+                reducer=self.reducer(['mean']),
+                scale=scale,
+                tileScale=self.tile_scale
+            )
+            for features, scale in self.pages[page]
+        ]
+        collection = reduced[0]
+        for other in reduced[1:]:
+            collection = collection.merge(other)
         
-    except Exception as e:
-        error_msg = str(e)
-        if 'size' in error_msg.lower() or 'too large' in error_msg.lower():
-            print(f"\n   ❌ Error: Dataset too large for direct download")
-            print(f"   Error: {error_msg}")
-            print(f"\n   💡 Solution: Use export method instead")
-            print(f"   Run with --use-export flag or modify code to use export")
-            raise ValueError(
-                "Dataset too large for direct download. "
-                "Please use export method (see GEE_API_EXPLAINED.md for details)"
+        extra = self.stats[1:]
+        if extra:
+            # Native-grid pixel statistics, added to the features that already hold the mean
+            collection = image.reduceRegions(
+                collection=collection,
+                reducer=self.reducer(extra).unweighted(),
+                crs='EPSG:4326',
+                crsTransform=CHIRPS_CRS_TRANSFORM,
+                tileScale=self.tile_scale
             )
-        else:
-            raise
+        return collection
+    
+    def escalate(self) -> bool:
+        """Double tileScale after a memory error; returns False once max_tile_scale is reached."""
+        if self.tile_scale >= self.max_tile_scale:
+            return False
+        self.tile_scale = min(self.tile_scale * 2, self.max_tile_scale)
+        return True
+
+
+def _normalize_stats(stats: Optional[List[str]]) -> List[str]:
+    """Validate requested stats and put 'mean' first (it is always needed)."""
+    stats = list(stats or [])
+    unknown = [stat for stat in stats if stat not in STAT_REDUCERS]
+    if unknown:
+        raise ValueError(f"Unknown statistics {unknown}. Choose from: {list(STAT_REDUCERS)}")
+    return ['mean'] + [stat for stat in dict.fromkeys(stats) if stat != 'mean']
 
 
-def _download_via_export(collection, admin_field, admin_code_field, drive_folder='CHIRPS'):
+def _is_memory_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return 'memory limit exceeded' in message or 'out of memory' in message
+
+
+# Earth Engine messages for requests that would succeed if made smaller
+SIZE_ERROR_MARKERS = (
+    'payload size exceeds',
+    'response size exceeds',
+    'accumulating over',
+    'too many elements'
+)
+
+
+def _is_size_error(error: Exception) -> bool:
+    """True for payload, element-count or memory limit errors; a smaller request may succeed."""
+    message = str(error).lower()
+    return _is_memory_error(error) or any(marker in message for marker in SIZE_ERROR_MARKERS)
+
+
+def download_chirps_data(
+    shapefile_path: Optional[str] = None,
+    country_name: Optional[Union[str, List[str]]] = None,
+    admin_level: int = 2,
+    admin_field: str = "ADM2_NAME",
+    admin_names: Optional[List[str]] = None,
+    country_filter: Optional[str] = None,
+    use_gee_boundaries: bool = False,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    cache: Optional[QueryCache] = None,
+    max_records_per_request: int = 5000,
+    history_path: str = DEFAULT_RUN_HISTORY
+) -> Tuple[pd.DataFrame, str, str]:
     """
-    Download data using Earth Engine export to Google Drive.
-    
-    This method exports data to Google Drive, then you download it manually
-    or programmatically. More reliable for large datasets.
+    Download CHIRPS pentad (5-day) data from Google Earth Engine into a single DataFrame.
     
-    Note: This requires manual download from Drive, or you can use
-    Google Drive API to automate the download step.
-    """
-    import time
-    from datetime import datetime
+    For callers that want the records in memory rather than the pipeline's CSV outputs.
+    The download is planned with plan_download and fetched with the same bounded,
+    streamed requests as the pipeline; the windows are then concatenated.
     
-    print("   Exporting data to Google Drive...")
-    print("   (This will take 10-30 minutes depending on data size)")
+    Args:
+        shapefile_path: Path to shapefile (optional if use_gee_boundaries=True)
+        country_name: Country name (or list of names) for GEE boundaries (required if use_gee_boundaries=True)
+        admin_level: Admin level for GEE (0=country, 1=province, 2=district)
+        admin_field: Field name in shapefile that contains admin area names (default: "ADM2_NAME")
+        admin_names: Optional list of specific admin area names to filter
+        country_filter: Optional country name to filter (deprecated, use country_name)
+        use_gee_boundaries: If True, load boundaries from GEE instead of shapefile
+        start_date: First day to fetch (YYYY-MM-DD, default: start of the collection)
+        end_date: Day after the last day to fetch (YYYY-MM-DD, default: newest image)
+        cache: Optional QueryCache; identical queries are then served from disk
+        max_records_per_request: Upper bound on (image, feature) records per Earth Engine request
+        history_path: Run history used to calibrate the download plan
     
-    # Create export task
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    task = ee.batch.Export.table.toDrive(
-        collection=collection,
-        description=f'chirps_export_{timestamp}',
-        folder=drive_folder,
-        fileNamePrefix=f'chirps_export_{timestamp}',
-        fileFormat='CSV'
+    Returns:
+        Tuple of (DataFrame with the admin attributes, 'system:index', 'system:time_start',
+        'mean' and 'id' per record, admin_field, admin_code_field)
+    """
+    gdf, admin_field, admin_code_field = prepare_admin_boundaries(
+        shapefile_path=shapefile_path,
+        country_name=country_name,
+        admin_level=admin_level,
+        admin_field=admin_field,
+        admin_names=admin_names,
+        country_filter=country_filter,
+        use_gee_boundaries=use_gee_boundaries
     )
+    attributes = _admin_attributes(gdf)
     
-    # Start the task
-    task.start()
-    print(f"   ✓ Export task started: {task.id}")
-    print(f"   Task name: chirps_export_{timestamp}")
-    
-    # Monitor task status
-    print("\n   Monitoring export progress...")
-    print("   (You can check status in Earth Engine Code Editor: https://code.earthengine.google.com/)")
+    print("\n Step 3: Loading CHIRPS PENTAD dataset from Earth Engine...")
+    dataset = ee.ImageCollection(CHIRPS_COLLECTIONS['pentad']).select('precipitation')
+    range_start, range_end = _resolve_date_range(dataset, start_date, end_date)
+    print(f"   CHIRPS data range: {range_start} to {range_end} (exclusive)")
+    
+    plan = plan_download(
+        'pentad', attributes['id'], range_start, range_end,
+        max_records_per_request=max_records_per_request,
+        history_path=history_path
+    )
+    print_plan(plan)
+    reduction = ZonalReduction(gdf, page_size=plan['page_size'])
     
-    max_wait_time = 3600  # 1 hour max wait
-    start_time = time.time()
-    check_interval = 30  # Check every 30 seconds
+    print("\n Step 4: Calculating spatial averages (this may take several minutes)...")
+    chunks = [
+        chunk for _, chunk in
+        stream_pentad_chirps(reduction, range_start, range_end, max_records_per_request, cache)
+    ]
+    records = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=['id', 'system:time_start', 'mean'])
+    df = _join_attributes(records, attributes)
     
-    while task.active() and (time.time() - start_time) < max_wait_time:
-        status = task.status()
-        state = status.get('state', 'UNKNOWN')
-        
-        if state == 'RUNNING':
-            print(f"   ⏳ Status: {state} (elapsed: {int(time.time() - start_time)}s)")
-        elif state == 'READY':
-            print(f"   ✓ Status: {state} - Export complete!")
-            break
-        elif state in ['FAILED', 'CANCELLED']:
-            error = status.get('error_message', 'Unknown error')
-            raise RuntimeError(f"Export failed: {error}")
-        
-        time.sleep(check_interval)
+    print(f"   ✓ Downloaded {len(df)} records")
+    if len(df) > 0:
+        print(f"   ✓ Date range: {df['system:time_start'].min()} to {df['system:time_start'].max()}")
     
-    if task.active():
-        print(f"\n   ⚠️  Export still running after {max_wait_time}s")
-        print(f"   Task ID: {task.id}")
-        print(f"   Check status: https://code.earthengine.google.com/")
-        print(f"   File will be in Google Drive folder: {drive_folder}")
-        raise TimeoutError(
-            "Export taking longer than expected. "
-            f"Check Google Drive folder '{drive_folder}' for the file when complete."
-        )
+    if cache is not None:
+        print(f"   Query cache: {cache.hits} hits, {cache.misses} misses ({cache.cache_dir})")
     
-    # Get final status
-    final_status = task.status()
-    if final_status['state'] == 'COMPLETED':
-        print(f"\n   ✅ Export completed successfully!")
-        print(f"   📁 File location: Google Drive → {drive_folder} → chirps_export_{timestamp}.csv")
-        print(f"\n   Next steps:")
-        print(f"   1. Go to https://drive.google.com")
-        print(f"   2. Navigate to folder: {drive_folder}")
-        print(f"   3. Download: chirps_export_{timestamp}.csv")
-        print(f"   4. Load it: df = pd.read_csv('chirps_export_{timestamp}.csv')")
-        print(f"\n   Or use Google Drive API to download programmatically")
-        
-        # Return empty DataFrame with note
-        return pd.DataFrame({
-            'note': ['Data exported to Google Drive - download manually']
-        })
-    else:
-        raise RuntimeError(f"Export did not complete: {final_status}")
+    return df, admin_field, admin_code_field
 
 
 def format_output_dataframe(df: pd.DataFrame, admin_field: str, admin_code_field: str, preserve_full_format: bool = True) -> pd.DataFrame:
@@ -706,129 +923,2353 @@ def create_admin_defaults(
     return admin_defaults
 
 
-def process_chirps_pipeline(
-    shapefile_path: Optional[str] = None,
-    country_name: Optional[str] = None,
-    admin_level: int = 2,
-    admin_field: str = "ADM2_NAME",
-    admin_names: Optional[List[str]] = None,
-    country_filter: Optional[str] = None,
-    use_gee_boundaries: bool = False,
-    output_dir: str = "./output",
+def _iter_date_windows(start_date: str, end_date: str, window_days: int):
+    """Yield consecutive [start, end) date windows (YYYY-MM-DD strings) covering start_date..end_date."""
+    current = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date)
+    step = pd.Timedelta(days=window_days)
+    while current < end:
+        window_end = min(current + step, end)
+        yield current.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d')
+        current = window_end
+
+
+def _iter_month_windows(start_date: str, end_date: str, window_months: int):
+    """Like _iter_date_windows, but windows end on month boundaries so no pentad/dekad is split."""
+    current = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date)
+    while current < end:
+        window_end = min(current.to_period('M').start_time + pd.DateOffset(months=window_months), end)
+        yield current.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d')
+        current = window_end
+
+
+def _resolve_date_range(
+    dataset: ee.ImageCollection,
     start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    early_first: int = 31,
-    early_last: int = 39,
-    late_first: int = 40,
-    late_last: int = 48
+    end_date: Optional[str] = None
 ) -> Tuple[str, str]:
     """
-    Main pipeline function that processes CHIRPS data from shapefile or GEE boundaries to formatted CSVs.
+    Find the [start, end) range of images actually available in a CHIRPS collection.
     
-    Args:
-        shapefile_path: Path to shapefile (optional if use_gee_boundaries=True)
-        country_name: Country name for GEE boundaries (required if use_gee_boundaries=True)
-        admin_level: Admin level for GEE (0=country, 1=province, 2=district)
-        admin_field: Field name containing admin area names (for shapefile mode)
-        admin_names: Optional list of specific admin areas to process
-        country_filter: Optional country name filter (deprecated, use country_name)
-        use_gee_boundaries: If True, load boundaries from GEE instead of shapefile
-        output_dir: Directory to save output files
-        early_first: First dekad of early season
-        early_last: Last dekad of early season
-        late_first: First dekad of late season
-        late_last: Last dekad of late season
-    
-    Returns:
-        Tuple of (chirps_csv_path, admin_csv_path)
+    Only collection metadata is queried, so this is cheap even for the DAILY product.
     """
-    # Initialize Earth Engine
-    initialize_earth_engine()
+    if start_date or end_date:
+        dataset = dataset.filterDate(start_date or '1981-01-01', end_date or '2099-12-31')
     
-    # Download CHIRPS data
-    df_raw, admin_field_used, admin_code_field = download_chirps_data(
-        shapefile_path=shapefile_path,
-        country_name=country_name,
-        admin_level=admin_level,
-        admin_field=admin_field,
-        admin_names=admin_names,
-        country_filter=country_filter,
-        use_gee_boundaries=use_gee_boundaries,
-        start_date=start_date,
-        end_date=end_date
-    )
+    bounds = ee.Dictionary({
+        'first': dataset.aggregate_min('system:time_start'),
+        'last': dataset.aggregate_max('system:time_start')
+    }).getInfo()
     
-    # Format output (preserve full format by default)
-    df_formatted = format_output_dataframe(df_raw, admin_field_used, admin_code_field, preserve_full_format=True)
+    if bounds.get('first') is None:
+        raise ValueError(f"No CHIRPS images found between {start_date} and {end_date or 'present'}")
     
-    # Create admin defaults
-    df_admin = create_admin_defaults(
-        df_raw,
-        admin_field_used,
-        admin_code_field,
-        early_first=early_first,
-        early_last=early_last,
-        late_first=late_first,
-        late_last=late_last
-    )
+    first = pd.to_datetime(bounds['first'], unit='ms')
+    last = pd.to_datetime(bounds['last'], unit='ms')
+    return first.strftime('%Y-%m-%d'), (last + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def _reduce_to_records(image: ee.Image, reduction: ZonalReduction, page: int = 0) -> ee.FeatureCollection:
+    """
+    Reduce one image and keep only (id, system:time_start, <stats>) per feature.
+    
+    Admin attributes are joined back locally, which keeps every response small.
+    """
+    time_start = image.get('system:time_start')
     
-    # Create output directory
-    os.makedirs(output_dir, exist_ok=True)
+    def to_record(feature):
+        properties = {'id': feature.id(), 'system:time_start': time_start}
+        properties.update({stat: feature.get(stat) for stat in reduction.stats})
+        return ee.Feature(None, properties)
     
-    # Save formatted CSVs
-    chirps_path = os.path.join(output_dir, "chirps_raw.csv")
-    admin_path = os.path.join(output_dir, "admin_raw.csv")
+    return reduction.reduce(image, page).map(to_record)
+
+
+class RunStats:
+    """Request measurements for a run, written to run_report.json and used to calibrate plans."""
+    
+    def __init__(self):
+        self.started = time.time()
+        self.requests = 0
+        self.cached_requests = 0
+        self.fetched_records = 0
+        self.fetched_bytes = 0
+        self.fetch_seconds = 0.0
+    
+    def record(self, features: list, seconds: float, cached: bool) -> None:
+        self.requests += 1
+        if cached:
+            # Cache hits say nothing about Earth Engine speed, so keep them out of calibration
+            self.cached_requests += 1
+            return
+        self.fetched_records += len(features)
+        self.fetched_bytes += len(json.dumps(features))
+        self.fetch_seconds += seconds
+
+
+def _fetch_records(
+    dataset: ee.ImageCollection,
+    reduction: ZonalReduction,
+    window_start: str,
+    window_end: str,
+    cache: Optional[QueryCache] = None,
+    run_stats: Optional[RunStats] = None,
+    page: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Reduce and download one date window as a DataFrame with reduction.record_columns.
     
-    print(f"\n💾 Step 7: Saving output files...")
-    # Save with all columns preserved (matches Earth Engine export format)
-    df_formatted.to_csv(chirps_path, index=False)
-    print(f"   ✓ Saved: {chirps_path}")
-    print(f"   Columns: {', '.join(df_formatted.columns[:5])}... ({len(df_formatted.columns)} total)")
+    Each feature page is a separate request. On "User memory limit exceeded" the
+    request is retried with a doubled tileScale; if that is already at its maximum, the
+    window is split in half instead.
+    """
+    if page is None:
+        return pd.concat([
+            _fetch_records(dataset, reduction, window_start, window_end, cache, run_stats, page)
+            for page in range(len(reduction.pages))
+        ], ignore_index=True)
+    
+    while True:
+        window = dataset.filterDate(window_start, window_end)\
+            .map(lambda image: _reduce_to_records(image, reduction, page))\
+            .flatten()
+        try:
+            hits_before = cache.hits if cache is not None else 0
+            request_start = time.time()
+            features = _get_info(window, cache, window_end)['features']
+            if run_stats is not None:
+                cached = cache is not None and cache.hits > hits_before
+                run_stats.record(features, time.time() - request_start, cached)
+            return pd.DataFrame([feature['properties'] for feature in features], columns=reduction.record_columns)
+        except ee.EEException as e:
+            if not _is_memory_error(e):
+                raise
+            if not reduction.escalate():
+                break
+            print(f"   ⚠️  Earth Engine memory limit hit - retrying with tileScale={reduction.tile_scale}")
+    
+    middle = pd.Timestamp(window_start) + (pd.Timestamp(window_end) - pd.Timestamp(window_start)) / 2
+    middle = middle.strftime('%Y-%m-%d')
+    if middle == window_start:
+        raise RuntimeError(
+            f"Earth Engine memory limit exceeded for a single day ({window_start}) "
+            f"even with tileScale={reduction.tile_scale}"
+        )
+    print(f"   ⚠️  Earth Engine memory limit hit - splitting {window_start} → {window_end} at {middle}")
+    return pd.concat([
+        _fetch_records(dataset, reduction, window_start, middle, cache, run_stats, page),
+        _fetch_records(dataset, reduction, middle, window_end, cache, run_stats, page)
+    ], ignore_index=True)
+
+
+def stream_pentad_chirps(
+    reduction: ZonalReduction,
+    start_date: str,
+    end_date: str,
+    max_records_per_request: int = 5000,
+    cache: Optional[QueryCache] = None,
+    run_stats: Optional[RunStats] = None
+):
+    """
+    Stream CHIRPS PENTAD zonal means in bounded, month-aligned windows.
     
-    df_admin.to_csv(admin_path, index=False)
-    print(f"   ✓ Saved: {admin_path}")
+    Windows hold whole months (6 pentads each), so every dekad is complete within the
+    window that contains it.
     
-    print(f"\n✅ Pipeline complete! Output files saved to {output_dir}")
+    Args:
+        reduction: Admin features and reduction parameters (also sizes the windows)
+        start_date: First day to fetch (YYYY-MM-DD)
+        end_date: Day after the last day to fetch (YYYY-MM-DD, exclusive)
+        max_records_per_request: Upper bound on records per getInfo() call
+        cache: Optional QueryCache; windows fetched before are read from disk
+        run_stats: Optional RunStats collecting request measurements
+    
+    Yields:
+        Tuples of (window_end, DataFrame with columns ['id', 'system:time_start', 'mean'])
+    """
+    dataset = ee.ImageCollection(CHIRPS_COLLECTIONS['pentad']).select('precipitation')
+    window_months = max(1, max_records_per_request // (6 * max(reduction.page_feature_count, 1)))
     
-    return chirps_path, admin_path
+    for window_start, window_end in _iter_month_windows(start_date, end_date, window_months):
+        chunk = _fetch_records(dataset, reduction, window_start, window_end, cache, run_stats)
+        print(f"   ⏳ {window_start} → {window_end}: {len(chunk)} pentad records")
+        yield window_end, chunk
 
 
-def main():
-    """Command-line interface for the CHIRPS pipeline."""
-    parser = argparse.ArgumentParser(
-        description="Download and format CHIRPS rainfall data for DESDR",
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
-Examples:
-  # Process all admin areas in shapefile:
-  python chirps_pipeline.py --shapefile madagascar.shp
-  
-  # Process specific admin areas:
-  python chirps_pipeline.py --shapefile madagascar.shp --admin-names "Manakara Atsimo,Toliary-I,Toliary-II"
-  
-  # With custom output directory and dekad ranges:
-  python chirps_pipeline.py --shapefile madagascar.shp --output-dir ./data --early-first 31 --early-last 39
-        """
-    )
+def stream_daily_chirps(
+    reduction: ZonalReduction,
+    start_date: str,
+    end_date: str,
+    max_records_per_request: int = 5000,
+    cache: Optional[QueryCache] = None,
+    run_stats: Optional[RunStats] = None
+):
+    """
+    Stream CHIRPS DAILY zonal means in bounded date windows.
     
-    parser.add_argument(
-        '--shapefile',
-        type=str,
-        default=None,
-        help='Path to shapefile containing admin boundaries (optional if using --use-gee-boundaries)'
-    )
+    Each window is reduced and downloaded on its own, so a single response never holds
+    more than ~max_records_per_request (day, feature) records.
     
-    parser.add_argument(
-        '--use-gee-boundaries',
-        action='store_true',
-        help='Load admin boundaries from Google Earth Engine (GAUL dataset) instead of shapefile'
-    )
+    Args:
+        reduction: Admin features and reduction parameters (also sizes the windows)
+        start_date: First day to fetch (YYYY-MM-DD)
+        end_date: Day after the last day to fetch (YYYY-MM-DD, exclusive)
+        max_records_per_request: Upper bound on records per getInfo() call
+        cache: Optional QueryCache; windows fetched before are read from disk
+        run_stats: Optional RunStats collecting request measurements
+    
+    Yields:
+        Tuples of (window_end, DataFrame with columns ['id', 'system:time_start', 'mean'])
+    """
+    dataset = ee.ImageCollection(CHIRPS_COLLECTIONS['daily']).select('precipitation')
+    window_days = max(1, max_records_per_request // max(reduction.page_feature_count, 1))
     
-    parser.add_argument(
-        '--country-name',
-        type=str,
+    for window_start, window_end in _iter_date_windows(start_date, end_date, window_days):
+        chunk = _fetch_records(dataset, reduction, window_start, window_end, cache, run_stats)
+        print(f"   ⏳ {window_start} → {window_end}: {len(chunk)} daily records")
+        yield window_end, chunk
+
+
+def count_images(product: str, start_date: str, end_date: str) -> int:
+    """Number of CHIRPS images in [start_date, end_date), computed from the calendar alone."""
+    days = pd.date_range(start_date, end_date, inclusive='left')
+    if product == 'daily':
+        return len(days)
+    return int(days.day.isin([1, 6, 11, 16, 21, 26]).sum())
+
+
+def _record_bytes(feature_ids, stats: Optional[List[str]] = None) -> int:
+    """Estimated JSON size of one slim record, from the width of the longest feature id and the stats."""
+    width = max((len(str(feature_id)) for feature_id in feature_ids), default=1)
+    sample = {
+        'type': 'Feature',
+        'geometry': None,
+        'id': '0' * (width + 9),  # flattened ids are prefixed with the image id
+        'properties': {'id': '0' * width, 'system:time_start': 10 ** 12}
+    }
+    sample['properties'].update({stat: 1 / 3 for stat in _normalize_stats(stats)})
+    return len(json.dumps(sample))
+
+
+def load_run_history(history_path: str = DEFAULT_RUN_HISTORY, product: Optional[str] = None, limit: int = 20) -> List[dict]:
+    """Most recent run reports (newest last) that measured Earth Engine requests."""
+    if not os.path.exists(history_path):
+        return []
+    reports = []
+    with open(history_path) as f:
+        for line in f:
+            try:
+                report = json.loads(line)
+            except ValueError:
+                continue
+            if report.get('source') == 'gee' and report.get('fetched_records') and \
+                    (product is None or report.get('product') == product):
+                reports.append(report)
+    return reports[-limit:]
+
+
+def plan_download(
+    product: str,
+    feature_ids,
+    start_date: str,
+    end_date: str,
+    max_records_per_request: int = 5000,
+    history_path: str = DEFAULT_RUN_HISTORY,
+    export_after_hours: float = 6.0,
+    stats: Optional[List[str]] = None
+) -> dict:
+    """
+    Predict the cost of a run and pick a download strategy before any heavy call.
+    
+    Uses only cheap inputs - the image count from the calendar, the feature count and
+    the record width - and calibrates bytes and seconds per record against past
+    run_report measurements when there are any.
+    
+    Strategies (cheapest first):
+    - direct: everything fits in a single getInfo() response
+    - chunked: date windows over all features (the streaming default)
+    - paginated: date windows x feature pages, when even one window over all features
+      exceeds max_records_per_request
+    
+    A Drive export is never chosen automatically (its output has to be downloaded by
+    hand); export_recommended is set when the expected wall time exceeds
+    export_after_hours, so --plan can suggest one.
+    
+    Returns:
+        Dict with records, response_bytes, requests, expected_seconds, strategy,
+        page_size (None unless paginated), export_recommended and the calibration used
+    """
+    feature_count = len(feature_ids)
+    image_count = count_images(product, start_date, end_date)
+    records = image_count * feature_count
+    record_bytes = _record_bytes(feature_ids, stats)
+    
+    # Calibrate against past runs: bytes as a ratio of the width estimate, seconds as a
+    # per-record cost plus a per-request overhead (least squares over the history)
+    history = load_run_history(history_path, product)
+    bytes_factor = 1.0
+    seconds_per_record, seconds_per_request = DEFAULT_SECONDS_PER_RECORD, DEFAULT_SECONDS_PER_REQUEST
+    if history:
+        bytes_factor = float(np.median([
+            r['fetched_bytes'] / (r['fetched_records'] * r['estimated_record_bytes']) for r in history
+        ]))
+        if len(history) >= 2:
+            design = np.array([[r['fetched_records'], r['requests'] - r['cached_requests']] for r in history], dtype=float)
+            seconds = np.array([r['fetch_seconds'] for r in history], dtype=float)
+            (per_record, per_request), *_ = np.linalg.lstsq(design, seconds, rcond=None)
+            if per_record > 0:
+                seconds_per_record, seconds_per_request = float(per_record), float(max(per_request, 0.0))
+        else:
+            seconds_per_record = history[0]['fetch_seconds'] / history[0]['fetched_records']
+            seconds_per_request = 0.0
+    
+    response_bytes = records * record_bytes * bytes_factor
+    images_per_window = 6 if product == 'pentad' else 1  # smallest window: one month / one day
+    page_size = None
+    
+    if records <= max_records_per_request and response_bytes <= GETINFO_MAX_BYTES:
+        strategy, requests = 'direct', 1
+    else:
+        if feature_count * images_per_window <= max_records_per_request:
+            strategy, page_features = 'chunked', feature_count
+        else:
+            page_size = max(1, max_records_per_request // images_per_window)
+            strategy, page_features = 'paginated', page_size
+        
+        if product == 'pentad':
+            window_months = max(1, max_records_per_request // (6 * page_features))
+            windows = sum(1 for _ in _iter_month_windows(start_date, end_date, window_months))
+        else:
+            window_days = max(1, max_records_per_request // page_features)
+            windows = sum(1 for _ in _iter_date_windows(start_date, end_date, window_days))
+        requests = windows * -(-feature_count // page_features)
+    
+    expected_seconds = records * seconds_per_record + requests * seconds_per_request
+    
+    return {
+        'product': product,
+        'start_date': start_date,
+        'end_date': end_date,
+        'feature_count': feature_count,
+        'image_count': image_count,
+        'records': records,
+        'estimated_record_bytes': record_bytes,
+        'response_bytes': int(response_bytes),
+        'requests': requests,
+        'expected_seconds': expected_seconds,
+        'strategy': strategy,
+        'page_size': page_size,
+        'export_recommended': expected_seconds > export_after_hours * 3600,
+        'calibration_runs': len(history),
+        'bytes_factor': bytes_factor,
+        'seconds_per_record': seconds_per_record,
+        'seconds_per_request': seconds_per_request
+    }
+
+
+def print_plan(plan: dict) -> None:
+    print("\n🧮 Download plan:")
+    print(f"   Images: {plan['image_count']:,} x admin areas: {plan['feature_count']:,} = {plan['records']:,} records")
+    print(f"   Estimated response size: ~{plan['response_bytes'] / 1024 / 1024:.1f} MB")
+    print(f"   Requests: {plan['requests']:,}")
+    print(f"   Expected wall time: ~{plan['expected_seconds'] / 60:.1f} min "
+          f"(calibrated from {plan['calibration_runs']} past runs)")
+    page_note = f", {plan['page_size']} features per page" if plan['page_size'] else ""
+    print(f"   Strategy: {plan['strategy']}{page_note}")
+    if plan['export_recommended']:
+        print("   💡 This run is long - consider a shorter date range, a --local-cube run "
+              "or a Drive export instead")
+
+
+def write_run_report(report: dict, output_dir: str, history_path: str = DEFAULT_RUN_HISTORY) -> str:
+    """Save run_report.json in the output directory and append it to the run history."""
+    report_path = os.path.join(output_dir, "run_report.json")
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    os.makedirs(os.path.dirname(history_path) or '.', exist_ok=True)
+    with open(history_path, 'a') as f:
+        f.write(json.dumps(report) + '\n')
+    return report_path
+
+
+def plan_chirps_pipeline(
+    shapefile_path: Optional[str] = None,
+    country_name: Optional[Union[str, List[str]]] = None,
+    admin_level: int = 2,
+    admin_field: str = "ADM2_NAME",
+    admin_names: Optional[List[str]] = None,
+    country_filter: Optional[str] = None,
+    use_gee_boundaries: bool = False,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    product: str = "pentad",
+    max_records_per_request: int = 5000,
+    history_path: str = DEFAULT_RUN_HISTORY,
+    stats: Optional[List[str]] = None
+) -> dict:
+    """
+    Dry run: load the boundaries and print the download plan without reducing anything.
+    
+    Earth Engine is only contacted for GEE boundaries or to look up the collection's
+    date range when start/end dates are not both given.
+    """
+    if use_gee_boundaries or not (start_date and end_date):
+        initialize_earth_engine()
+    
+    gdf, _, _ = prepare_admin_boundaries(
+        shapefile_path=shapefile_path,
+        country_name=country_name,
+        admin_level=admin_level,
+        admin_field=admin_field,
+        admin_names=admin_names,
+        country_filter=country_filter,
+        use_gee_boundaries=use_gee_boundaries
+    )
+    
+    if start_date and end_date:
+        range_start, range_end = start_date, end_date
+    else:
+        dataset = ee.ImageCollection(CHIRPS_COLLECTIONS[product]).select('precipitation')
+        range_start, range_end = _resolve_date_range(dataset, start_date, end_date)
+    
+    plan = plan_download(
+        product, gdf.index.astype(str), range_start, range_end,
+        max_records_per_request=max_records_per_request,
+        history_path=history_path,
+        stats=stats
+    )
+    print_plan(plan)
+    return plan
+
+
+CHIRPS_FILENAME_PATTERN = re.compile(r'(\d{4})\.(\d{2})\.(\d{1,2})\.tif(\.gz)?$')
+
+
+class LocalCube:
+    """
+    CHIRPS rasters stacked into a (time, row, col) float32 .npy cube plus a JSON sidecar.
+    
+    The cube is opened with np.load(mmap_mode='r'), so any number of worker processes
+    can read it through the OS page cache without copying it. The sidecar
+    (<cube>.json) holds the product, the grid origin/resolution and the image times.
+    """
+    
+    def __init__(self, cube_path: str):
+        self.cube_path = cube_path
+        with open(self.sidecar_path(cube_path)) as f:
+            meta = json.load(f)
+        self.product = meta['product']
+        self.x0, self.dx, self.y0, self.dy = meta['transform']
+        self.times = np.asarray(meta['times'], dtype='int64')
+        self.data = np.load(cube_path, mmap_mode='r')
+    
+    @staticmethod
+    def sidecar_path(cube_path: str) -> str:
+        return os.path.splitext(cube_path)[0] + '.json'
+    
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.data.shape[1], self.data.shape[2]
+    
+    def time_slice(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> slice:
+        """Index range of images with start_date <= time < end_date."""
+        start = 0 if start_date is None else int(np.searchsorted(self.times, _date_to_ms(start_date)))
+        stop = len(self.times) if end_date is None else int(np.searchsorted(self.times, _date_to_ms(end_date)))
+        return slice(start, stop)
+    
+    def window(self, bounds: Tuple[float, float, float, float]) -> Tuple[int, int, int, int]:
+        """Row/col window (row0, row1, col0, col1) covering a (minx, miny, maxx, maxy) box, clipped to the grid."""
+        minx, miny, maxx, maxy = bounds
+        rows, cols = self.shape
+        col0 = max(int(np.floor((minx - self.x0) / self.dx)), 0)
+        col1 = min(int(np.ceil((maxx - self.x0) / self.dx)), cols)
+        row0 = max(int(np.floor((maxy - self.y0) / self.dy)), 0)
+        row1 = min(int(np.ceil((miny - self.y0) / self.dy)), rows)
+        return row0, row1, col0, col1
+    
+    def pixel_centers(self, row0: int, row1: int, col0: int, col1: int) -> Tuple[np.ndarray, np.ndarray]:
+        """x/y coordinates of the pixel centres in a window, as 2-D grids."""
+        xs = self.x0 + (np.arange(col0, col1) + 0.5) * self.dx
+        ys = self.y0 + (np.arange(row0, row1) + 0.5) * self.dy
+        return np.meshgrid(xs, ys)
+
+
+def build_local_cube(
+    raster_paths: List[str],
+    cube_path: str,
+    bbox: Optional[Tuple[float, float, float, float]] = None
+) -> str:
+    """
+    Stack CHIRPS GeoTIFFs (as published on data.chc.ucsb.edu) into a LocalCube.
+    
+    Files are recognised by their CHC names: chirps-v2.0.YYYY.MM.P.tif(.gz) for pentads
+    and chirps-v2.0.YYYY.MM.DD.tif(.gz) for daily data. Rasters are written one at a
+    time into a memory-mapped .npy, so building never holds more than one image.
+    
+    Requires rasterio (pip3 install rasterio).
+    
+    Args:
+        raster_paths: CHIRPS GeoTIFF paths (all of the same product and grid)
+        cube_path: Output .npy path (the sidecar is written next to it)
+        bbox: Optional (minx, miny, maxx, maxy) in degrees to crop the rasters to
+    
+    Returns:
+        cube_path
+    """
+    try:
+        import rasterio
+        from rasterio.windows import from_bounds
+    except ImportError:
+        raise ImportError("Building a local cube requires rasterio: pip3 install rasterio")
+    
+    dated = []
+    for path in raster_paths:
+        match = CHIRPS_FILENAME_PATTERN.search(os.path.basename(path))
+        if not match:
+            print(f"   ⚠️  Skipping {path}: not a CHIRPS file name")
+            continue
+        year, month, period = (int(part) for part in match.groups()[:3])
+        if len(match.group(3)) == 1:
+            dated.append((pd.Timestamp(year, month, (period - 1) * 5 + 1), 'pentad', path))
+        else:
+            dated.append((pd.Timestamp(year, month, period), 'daily', path))
+    
+    if not dated:
+        raise ValueError("No CHIRPS rasters found")
+    products = {product for _, product, _ in dated}
+    if len(products) > 1:
+        raise ValueError("Cannot mix pentad and daily rasters in one cube")
+    dated.sort()
+    
+    print(f"\n🧊 Building local {products.pop()} cube from {len(dated)} rasters...")
+    
+    def open_raster(path):
+        return rasterio.open(f"/vsigzip/{path}" if path.endswith('.gz') else path)
+    
+    with open_raster(dated[0][2]) as src:
+        window = from_bounds(*bbox, transform=src.transform).round_offsets().round_lengths() if bbox else None
+        transform = src.window_transform(window) if window else src.transform
+        height = int(window.height) if window else src.height
+        width = int(window.width) if window else src.width
+    
+    cube = np.lib.format.open_memmap(cube_path, mode='w+', dtype='float32', shape=(len(dated), height, width))
+    for i, (_, _, path) in enumerate(dated):
+        with open_raster(path) as src:
+            band = src.read(1, window=window, boundless=window is not None, fill_value=src.nodata or -9999)
+            nodata = src.nodata if src.nodata is not None else -9999
+        cube[i] = np.where(band == nodata, np.nan, band)
+    cube.flush()
+    del cube
+    
+    with open(LocalCube.sidecar_path(cube_path), 'w') as f:
+        json.dump({
+            'product': dated[0][1],
+            'transform': [transform.c, transform.a, transform.f, transform.e],
+            'times': [_date_to_ms(date) for date, _, _ in dated]
+        }, f)
+    
+    print(f"   ✓ Saved {cube_path} ({len(dated)} x {height} x {width})")
+    return cube_path
+
+
+def _shard_polygons(gdf: gpd.GeoDataFrame, shard_count: int) -> List[np.ndarray]:
+    """
+    Split polygons into spatially coherent shards of roughly equal size.
+    
+    Polygons are ordered along a Hilbert curve, so each shard covers a compact area and
+    its workers touch a small part of the cube.
+    """
+    order = np.argsort(gdf.hilbert_distance().to_numpy(), kind='stable')
+    return [shard for shard in np.array_split(order, shard_count) if len(shard)]
+
+
+def _block_stats(block: np.ndarray, stats: List[str]) -> dict:
+    """
+    Vectorized per-image statistics of a (time, pixels) block, ignoring NaN pixels.
+    
+    One pass over the block yields every requested stat; stdDev is the population
+    standard deviation, count the number of pixels with data.
+    """
+    valid = ~np.isnan(block)
+    counts = valid.sum(axis=1)
+    has_data = counts > 0
+    values = np.where(valid, block, 0)
+    mean = values.sum(axis=1) / np.maximum(counts, 1)
+    
+    results = {}
+    for stat in stats:
+        if stat == 'mean':
+            results[stat] = mean
+        elif stat == 'min':
+            results[stat] = np.where(valid, block, np.inf).min(axis=1)
+        elif stat == 'max':
+            results[stat] = np.where(valid, block, -np.inf).max(axis=1)
+        elif stat == 'stdDev':
+            variance = (values ** 2).sum(axis=1) / np.maximum(counts, 1) - mean ** 2
+            results[stat] = np.sqrt(np.maximum(variance, 0))
+        elif stat == 'count':
+            results[stat] = counts
+            continue
+        results[stat] = np.where(has_data, results[stat], np.nan)
+    return results
+
+
+# Per-worker cache of polygon pixel masks, keyed by (cube path, shard positions), so
+# later time blocks of a shard skip the point-in-polygon tests
+_SHARD_MASKS = {}
+
+
+def _shard_masks(cube: LocalCube, positions: np.ndarray, geometries: list) -> list:
+    """
+    (row0, row1, col0, col1, mask, fallback) per polygon, or None for polygons off the grid.
+    
+    fallback marks polygons without any pixel centre inside, whose window is the single
+    pixel under their representative point.
+    """
+    key = (cube.cube_path, positions.tobytes())
+    if key not in _SHARD_MASKS:
+        masks = []
+        for geometry in geometries:
+            row0, row1, col0, col1 = cube.window(geometry.bounds)
+            if not (row0 < row1 and col0 < col1):
+                masks.append(None)
+                continue
+            xs, ys = cube.pixel_centers(row0, row1, col0, col1)
+            mask = shapely.contains_xy(geometry, xs, ys)
+            fallback = not mask.any()
+            if fallback:
+                point = geometry.representative_point()
+                rows, cols = cube.shape
+                row0 = int(np.floor((point.y - cube.y0) / cube.dy))
+                col0 = int(np.floor((point.x - cube.x0) / cube.dx))
+                if not (0 <= row0 < rows and 0 <= col0 < cols):
+                    masks.append(None)  # Representative point off the grid (e.g. on the --cube-bbox edge)
+                    continue
+                row1, col1 = row0 + 1, col0 + 1
+                mask = np.ones((1, 1), dtype=bool)
+            masks.append((row0, row1, col0, col1, mask, fallback))
+        _SHARD_MASKS[key] = masks
+    return _SHARD_MASKS[key]
+
+
+def _empty_stats(stats: List[str], shape: Tuple[int, int]) -> dict:
+    """Result arrays before any pixel is seen: NaN float32, except an int32 count of 0 (as Earth Engine returns it)."""
+    return {
+        stat: np.zeros(shape, dtype='int32') if stat == 'count' else np.full(shape, np.nan, dtype='float32')
+        for stat in stats
+    }
+
+
+def _reduce_shard(
+    cube_path: str,
+    positions: np.ndarray,
+    geometries: list,
+    time_range: Tuple[int, int],
+    stats: List[str]
+):
+    """
+    Worker: statistics of the pixels whose centres fall inside each polygon, for every image.
+    
+    Polygons too small to contain a pixel centre take their mean from the pixel under
+    their representative point, mirroring the small-polygon handling of the GEE path;
+    like there, their other stats stay empty and their count is 0.
+    """
+    cube = LocalCube(cube_path)
+    t0, t1 = time_range
+    results = _empty_stats(stats, (len(geometries), t1 - t0))
+    
+    for i, window in enumerate(_shard_masks(cube, positions, geometries)):
+        if window is None:
+            continue
+        row0, row1, col0, col1, mask, fallback = window
+        block = cube.data[t0:t1, row0:row1, col0:col1][:, mask]
+        if block.size:
+            for stat, values in _block_stats(block, ['mean'] if fallback else stats).items():
+                results[stat][i] = values
+    
+    return positions, results
+
+
+def _submit_shards(executor, cube: LocalCube, shards: List[np.ndarray], geometries: np.ndarray,
+                   time_range: Tuple[int, int], stats: List[str]) -> list:
+    return [
+        executor.submit(_reduce_shard, cube.cube_path, shard, list(geometries[shard]), time_range, stats)
+        for shard in shards
+    ]
+
+
+def _collect_shards(futures: list, feature_count: int, image_count: int, stats: List[str]) -> dict:
+    """Place shard results back in gdf order."""
+    results = _empty_stats(stats, (feature_count, image_count))
+    for future in futures:
+        positions, shard_results = future.result()
+        for stat, values in shard_results.items():
+            results[stat][positions] = values
+    return results
+
+
+def zonal_stats_local(
+    cube: LocalCube,
+    gdf: gpd.GeoDataFrame,
+    time_slice: slice,
+    workers: Optional[int] = None,
+    stats: Optional[List[str]] = None
+) -> dict:
+    """
+    Zonal statistics of every polygon over a time slice of a LocalCube, in a process pool.
+    
+    Polygons are split into spatial shards (several per worker for load balancing);
+    each worker memory-maps the cube itself, and results are placed back in gdf order,
+    so the output is deterministic regardless of scheduling.
+    
+    Returns:
+        Dict of stat -> array of shape (len(gdf), number of images in time_slice)
+        (float32, int32 for count)
+    """
+    stats = _normalize_stats(stats)
+    workers = workers or os.cpu_count() or 1
+    shards = _shard_polygons(gdf, workers * 4)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = _submit_shards(executor, cube, shards, gdf.geometry.to_numpy(),
+                                 (time_slice.start, time_slice.stop), stats)
+        return _collect_shards(futures, len(gdf), time_slice.stop - time_slice.start, stats)
+
+
+def stream_local_chirps(
+    cube: LocalCube,
+    gdf: gpd.GeoDataFrame,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    max_records_per_request: int = 5000,
+    workers: Optional[int] = None,
+    stats: Optional[List[str]] = None
+):
+    """
+    Local equivalent of stream_pentad_chirps/stream_daily_chirps backed by a LocalCube.
+    
+    The range is reduced in month-aligned windows of about max_records_per_request
+    records, each window in parallel across the process pool. The next window is
+    queued while the current one is yielded, so the workers stay busy but only two
+    windows of results are ever held in memory.
+    
+    Yields:
+        Tuples of (window_end, DataFrame with columns ['id', 'system:time_start', <stats>])
+    """
+    stats = _normalize_stats(stats)
+    time_slice = cube.time_slice(start_date, end_date)
+    times = cube.times[time_slice]
+    if len(times) == 0:
+        return
+    
+    workers = workers or os.cpu_count() or 1
+    print(f"   Reducing {len(gdf)} polygons x {len(times)} images with {workers} workers...")
+    ids = gdf.index.astype(str).to_numpy()
+    shards = _shard_polygons(gdf, workers * 4)
+    geometries = gdf.geometry.to_numpy()
+    
+    per_month = 6 if cube.product == 'pentad' else 31
+    window_months = max(1, max_records_per_request // (per_month * max(len(gdf), 1)))
+    dates = pd.to_datetime(times, unit='ms')
+    first = dates[0].strftime('%Y-%m-%d')
+    last = (dates[-1] + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    
+    # Image index ranges (into the cube) of each non-empty window; times are sorted
+    windows = []
+    for window_start, window_end in _iter_month_windows(first, last, window_months):
+        selected = np.flatnonzero((dates >= window_start) & (dates < window_end))
+        if len(selected):
+            windows.append((window_end, time_slice.start + selected[0], time_slice.start + selected[-1] + 1))
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        submit = lambda window: _submit_shards(executor, cube, shards, geometries, window[1:], stats)
+        pending = submit(windows[0])
+        for i, (window_end, t0, t1) in enumerate(windows):
+            futures, pending = pending, (submit(windows[i + 1]) if i + 1 < len(windows) else None)
+            results = _collect_shards(futures, len(gdf), t1 - t0, stats)
+            chunk = pd.DataFrame({
+                'id': np.tile(ids, t1 - t0),
+                'system:time_start': np.repeat(cube.times[t0:t1], len(ids)),
+                **{stat: values.T.ravel() for stat, values in results.items()}
+            })
+            yield window_end, chunk
+
+
+def load_points(points_path: str, id_field: Optional[str] = None) -> Tuple[gpd.GeoDataFrame, str, str]:
+    """
+    Load stations/points from a CSV with longitude and latitude columns.
+    
+    Each point is treated like an admin area: its id becomes ADM2_CODE (the gid) and
+    its name (or id) ADM2_NAME, so the outputs keep the chirps_raw.csv schema.
+    
+    Args:
+        points_path: CSV with lon/lat (or longitude/latitude, x/y) columns
+        id_field: Column holding the station id (default: id, station_id, station, code or
+            the row number)
+    
+    Returns:
+        Tuple of (point GeoDataFrame in EPSG:4326, admin_field, admin_code_field)
+    """
+    print(f"\n📥 Step 1: Loading points from {points_path}")
+    df = pd.read_csv(points_path)
+    columns = {col.lower(): col for col in df.columns}
+    
+    def find_column(candidates):
+        for candidate in candidates:
+            if candidate in columns:
+                return columns[candidate]
+        return None
+    
+    lon_field = find_column(['lon', 'longitude', 'lng', 'x'])
+    lat_field = find_column(['lat', 'latitude', 'y'])
+    if lon_field is None or lat_field is None:
+        raise ValueError(f"Could not find longitude/latitude columns in {points_path}. Available fields: {list(df.columns)}")
+    
+    id_field = id_field or find_column(['id', 'station_id', 'station', 'code'])
+    if id_field is not None and id_field not in df.columns:
+        raise ValueError(f"Field '{id_field}' not found in {points_path}. Available fields: {list(df.columns)}")
+    ids = df[id_field] if id_field else pd.Series(np.arange(1, len(df) + 1), index=df.index)
+    if ids.duplicated().any():
+        raise ValueError(f"Duplicate point ids in {points_path}: {sorted(ids[ids.duplicated()].astype(str).unique())[:5]}")
+    name_field = find_column(['name', 'station_name'])
+    
+    gdf = gpd.GeoDataFrame(
+        df.drop(columns=[lon_field, lat_field]),
+        geometry=gpd.points_from_xy(df[lon_field], df[lat_field]),
+        crs='EPSG:4326'
+    ).reset_index(drop=True)
+    gdf['ADM2_CODE'] = ids.to_numpy()
+    gdf['ADM2_NAME'] = (df[name_field] if name_field else ids).astype(str).to_numpy()
+    gdf['Shape_Area'] = 0.0
+    gdf['Shape_Leng'] = 0.0
+    _fill_desdr_fields(gdf, 'ADM2_NAME', 'ADM2_CODE')
+    print(f"   Found {len(gdf)} points")
+    return gdf, 'ADM2_NAME', 'ADM2_CODE'
+
+
+class PointGridIndex:
+    """
+    Precomputed mapping from points to the grid cells that contain them.
+    
+    Cells are computed once from the grid transform; points falling in the same cell
+    share a single series, so only the unique cells are read or requested.
+    """
+    
+    def __init__(
+        self,
+        lons: np.ndarray,
+        lats: np.ndarray,
+        transform: Tuple[float, float, float, float] = CHIRPS_GRID_TRANSFORM,
+        shape: Tuple[int, int] = CHIRPS_GRID_SHAPE
+    ):
+        self.transform = transform
+        self.grid_shape = shape
+        flat = self.flat_cells(lons, lats)
+        self.point_positions = np.flatnonzero(flat >= 0)
+        self.cells, self.point_cells = np.unique(flat[self.point_positions], return_inverse=True)
+        self.rows, self.cols = np.divmod(self.cells, shape[1])
+    
+    def flat_cells(self, lons, lats) -> np.ndarray:
+        """Row-major cell number of each coordinate, or -1 outside the grid."""
+        x0, dx, y0, dy = self.transform
+        cols = np.floor((np.asarray(lons, dtype='float64') - x0) / dx).astype('int64')
+        rows = np.floor((np.asarray(lats, dtype='float64') - y0) / dy).astype('int64')
+        inside = (rows >= 0) & (rows < self.grid_shape[0]) & (cols >= 0) & (cols < self.grid_shape[1])
+        return np.where(inside, rows * self.grid_shape[1] + cols, -1)
+    
+    def cell_positions(self, lons, lats) -> np.ndarray:
+        """Position in self.cells of the cell containing each coordinate (e.g. returned pixel centres)."""
+        flat = self.flat_cells(lons, lats)
+        positions = np.searchsorted(self.cells, flat).clip(0, max(len(self.cells) - 1, 0))
+        if len(self.cells) == 0 or not np.array_equal(self.cells[positions], flat):
+            raise ValueError("Coordinates do not match the indexed grid cells")
+        return positions
+    
+    def cell_centers(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Longitude/latitude of the centre of each unique cell."""
+        x0, dx, y0, dy = self.transform
+        return x0 + (self.cols + 0.5) * dx, y0 + (self.rows + 0.5) * dy
+
+
+def _point_ids(gdf: gpd.GeoDataFrame, index: PointGridIndex) -> np.ndarray:
+    """Feature ids of the points inside the grid, warning about the others."""
+    outside = len(gdf) - len(index.point_positions)
+    if outside:
+        print(f"   ⚠️  {outside} points fall outside the CHIRPS grid and are skipped")
+    print(f"   {len(index.point_positions)} points map to {len(index.cells)} unique CHIRPS cells")
+    return gdf.index.astype(str).to_numpy()[index.point_positions]
+
+
+def stream_local_points(
+    cube: LocalCube,
+    gdf: gpd.GeoDataFrame,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    max_records_per_request: int = 5000
+):
+    """
+    Point extraction from a LocalCube: one vectorized gather of the unique cells per window.
+    
+    Yields:
+        Tuples of (window_end, DataFrame with columns ['id', 'system:time_start', 'mean'])
+    """
+    index = PointGridIndex(
+        gdf.geometry.x.to_numpy(), gdf.geometry.y.to_numpy(),
+        transform=(cube.x0, cube.dx, cube.y0, cube.dy),
+        shape=cube.shape
+    )
+    ids = _point_ids(gdf, index)
+    time_slice = cube.time_slice(start_date, end_date)
+    times = cube.times[time_slice]
+    if len(times) == 0 or len(ids) == 0:
+        return
+    
+    per_month = 6 if cube.product == 'pentad' else 31
+    window_months = max(1, max_records_per_request // (per_month * len(ids)))
+    dates = pd.to_datetime(times, unit='ms')
+    first = dates[0].strftime('%Y-%m-%d')
+    last = (dates[-1] + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    
+    for window_start, window_end in _iter_month_windows(first, last, window_months):
+        selected = np.flatnonzero((dates >= window_start) & (dates < window_end))
+        if len(selected) == 0:
+            continue
+        start = time_slice.start + selected[0]
+        # Fancy indexing on the memmap only touches the requested cells
+        values = np.asarray(cube.data[start:start + len(selected), index.rows, index.cols])
+        values = values[:, index.point_cells]
+        chunk = pd.DataFrame({
+            'id': np.tile(ids, len(selected)),
+            'system:time_start': np.repeat(times[selected], len(ids)),
+            'mean': values.ravel()
+        })
+        yield window_end, chunk
+
+
+def stream_gee_points(
+    gdf: gpd.GeoDataFrame,
+    product: str,
+    start_date: str,
+    end_date: str,
+    max_records_per_request: int = 5000,
+    cache: Optional[QueryCache] = None,
+    run_stats: Optional[RunStats] = None
+):
+    """
+    Point extraction on Earth Engine: one getRegion() call per window for all unique cells.
+    
+    The cell centres are sampled on the native CHIRPS grid (crsTransform), so every
+    returned pixel maps straight back to its cell through the PointGridIndex.
+    
+    Args:
+        gdf: Points from load_points
+        product: 'pentad' or 'daily'
+        start_date: First day to fetch (YYYY-MM-DD)
+        end_date: Day after the last day to fetch (YYYY-MM-DD, exclusive)
+        max_records_per_request: Upper bound on (image, cell) rows per getRegion() call
+        cache: Optional QueryCache; windows fetched before are read from disk
+        run_stats: Optional RunStats collecting request measurements
+    
+    Yields:
+        Tuples of (window_end, DataFrame with columns ['id', 'system:time_start', 'mean'])
+    """
+    index = PointGridIndex(gdf.geometry.x.to_numpy(), gdf.geometry.y.to_numpy())
+    ids = _point_ids(gdf, index)
+    if len(ids) == 0:
+        return
+    
+    lons, lats = index.cell_centers()
+    cells = ee.Geometry.MultiPoint(np.column_stack([lons, lats]).tolist())
+    points = pd.DataFrame({'id': ids, 'cell': index.point_cells})
+    dataset = ee.ImageCollection(CHIRPS_COLLECTIONS[product]).select('precipitation')
+    
+    if product == 'pentad':
+        windows = _iter_month_windows(start_date, end_date, max(1, max_records_per_request // (6 * len(index.cells))))
+    else:
+        windows = _iter_date_windows(start_date, end_date, max(1, max_records_per_request // len(index.cells)))
+    
+    for window_start, window_end in windows:
+        region = dataset.filterDate(window_start, window_end).getRegion(cells, crs='EPSG:4326', crsTransform=CHIRPS_CRS_TRANSFORM)
+        hits_before = cache.hits if cache is not None else 0
+        request_start = time.time()
+        table = _get_info(region, cache, window_end)
+        if run_stats is not None:
+            cached = cache is not None and cache.hits > hits_before
+            run_stats.record(table[1:], time.time() - request_start, cached)
+        
+        # getRegion rows are [image id, longitude, latitude, time, precipitation]
+        values = pd.DataFrame(table[1:], columns=table[0]).drop(columns='id')
+        values['cell'] = index.cell_positions(values['longitude'], values['latitude'])
+        chunk = points.merge(values, on='cell')\
+            .rename(columns={'time': 'system:time_start', 'precipitation': 'mean'})\
+            .sort_values(['system:time_start'], kind='stable')[['id', 'system:time_start', 'mean']]\
+            .reset_index(drop=True)
+        print(f"   ⏳ {window_start} → {window_end}: {len(chunk)} point records from {len(values)} cell values")
+        yield window_end, chunk
+
+
+def _period_bounds(dates: pd.Series, period_days: int, periods_per_month: int) -> Tuple[pd.Series, pd.Series]:
+    """
+    Return the start and (exclusive) end of the CHIRPS pentad/dekad containing each date.
+    
+    Pentads start on days 1, 6, 11, 16, 21, 26 and dekads on days 1, 11, 21; the last
+    period of each month runs to the end of the month.
+    """
+    day = dates.dt.day
+    month_start = dates - pd.to_timedelta(day - 1, unit='D')
+    offset = ((day - 1) // period_days).clip(upper=periods_per_month - 1) * period_days
+    start = month_start + pd.to_timedelta(offset, unit='D')
+    is_last = offset == (periods_per_month - 1) * period_days
+    end = (start + pd.Timedelta(days=period_days)).where(~is_last, month_start + pd.offsets.MonthBegin(1))
+    return start, end
+
+
+def _to_epoch_ms(dates: pd.Series) -> pd.Series:
+    """Convert datetimes to Earth Engine style 'system:time_start' milliseconds."""
+    return (dates - pd.Timestamp('1970-01-01')) // pd.Timedelta(milliseconds=1)
+
+
+def _date_to_ms(date) -> int:
+    """Convert a single date (string or Timestamp) to 'system:time_start' milliseconds."""
+    return int((pd.Timestamp(date) - pd.Timestamp('1970-01-01')) // pd.Timedelta(milliseconds=1))
+
+
+class DailyAggregator:
+    """
+    Fold a chronological stream of daily zonal means into pentads and dekads.
+    
+    Besides rainfall totals, each dekad gets daily-derived metrics:
+    - rain_days: number of days with rainfall >= wet_day_threshold
+    - max_dry_spell: longest run of consecutive dry days seen in the dekad
+      (runs are carried across dekad and chunk boundaries)
+    
+    Only still-open periods (about one pentad and one dekad per feature) and the running
+    dry spell per feature are kept between chunks, so memory does not grow with the
+    date range.
+    
+    The dry spell running into each of the last few month starts is kept in
+    month_start_dry_spells, so a later run that resumes at one of those months (a
+    refresh) can pass it back in as dry_spell and continue the runs instead of
+    restarting them at zero.
+    
+    Periods are only emitted once a daily image has been seen for every one of their
+    days. A partial total (a start date inside a period, or the final flush before the
+    period is over) would be indistinguishable from a dry period, so it is dropped.
+    """
+    
+    KEPT_MONTH_STARTS = 3
+    
+    def __init__(self, wet_day_threshold: float = 1.0, dry_spell: Optional[dict] = None):
+        self.wet_day_threshold = wet_day_threshold
+        # days counts days with a value, images every daily image seen (missing values included)
+        bounds = {'start': 'datetime64[ns]', 'end': 'datetime64[ns]'}
+        self._open_pentads = pd.DataFrame(columns=['id', 'start', 'end', 'value', 'days', 'images']).astype(bounds)
+        self._open_dekads = pd.DataFrame(
+            columns=['id', 'start', 'end', 'value', 'days', 'images', 'rain_days', 'max_dry_spell']
+        ).astype(bounds)
+        # id -> dry days running at the end of the last chunk (or before the first one)
+        self._dry_spell = pd.Series(dry_spell or {}, dtype=float)
+        self.month_start_dry_spells = {}  # 'YYYY-MM-DD' -> {id: dry days running into that day}
+    
+    def update(self, chunk: pd.DataFrame) -> None:
+        """Add one chunk of daily records (columns: id, system:time_start, mean)."""
+        chunk = chunk.dropna(subset=['system:time_start'])
+        if chunk.empty:
+            return
+        
+        daily = pd.DataFrame({
+            'id': chunk['id'].astype(str),
+            'date': pd.to_datetime(chunk['system:time_start'], unit='ms').dt.normalize(),
+            'value': pd.to_numeric(chunk['mean'], errors='coerce')
+        }).sort_values(['id', 'date'], ignore_index=True)
+        
+        # Missing days count as neither wet nor dry and break a dry spell
+        dry = daily['value'] < self.wet_day_threshold
+        daily['rain_day'] = (daily['value'] >= self.wet_day_threshold).astype(int)
+        
+        # Length of the dry run ending on each day; runs open at the start of the chunk
+        # continue the run carried over from the previous chunk
+        run_id = (~dry).astype(int).groupby(daily['id']).cumsum()
+        run_length = dry.astype(int).groupby([daily['id'], run_id]).cumsum()
+        carried = daily['id'].map(self._dry_spell).fillna(0)
+        daily['dry_spell'] = run_length + carried.where(dry & (run_id == 0), 0)
+        
+        first_date = daily['date'].min()
+        if first_date.is_month_start:
+            self._keep_month_start(first_date, self._dry_spell)
+        for date, days in daily[daily['date'].dt.is_month_end].groupby('date'):
+            self._keep_month_start(date + pd.Timedelta(days=1), days.set_index('id')['dry_spell'])
+        
+        last_day = daily.groupby('id').tail(1).set_index('id')['dry_spell']
+        self._dry_spell = last_day.combine_first(self._dry_spell)
+        
+        daily['start'], daily['end'] = _period_bounds(daily['date'], 5, 6)
+        pentads = daily.groupby(['id', 'start', 'end'], as_index=False).agg(
+            value=('value', 'sum'), days=('value', 'count'), images=('date', 'size')
+        )
+        self._open_pentads = self._merge(
+            self._open_pentads, pentads, {'value': 'sum', 'days': 'sum', 'images': 'sum'}
+        )
+        
+        daily['start'], daily['end'] = _period_bounds(daily['date'], 10, 3)
+        dekads = daily.groupby(['id', 'start', 'end'], as_index=False).agg(
+            value=('value', 'sum'),
+            days=('value', 'count'),
+            images=('date', 'size'),
+            rain_days=('rain_day', 'sum'),
+            max_dry_spell=('dry_spell', 'max')
+        )
+        self._open_dekads = self._merge(
+            self._open_dekads, dekads,
+            {'value': 'sum', 'days': 'sum', 'images': 'sum', 'rain_days': 'sum', 'max_dry_spell': 'max'}
+        )
+    
+    def _keep_month_start(self, date: pd.Timestamp, dry_spell: pd.Series) -> None:
+        self.month_start_dry_spells.setdefault(
+            date.strftime('%Y-%m-%d'), {str(i): int(days) for i, days in dry_spell.items()}
+        )
+        for key in sorted(self.month_start_dry_spells)[:-self.KEPT_MONTH_STARTS]:
+            del self.month_start_dry_spells[key]
+    
+    @staticmethod
+    def _merge(open_periods: pd.DataFrame, new_periods: pd.DataFrame, how: dict) -> pd.DataFrame:
+        if open_periods.empty:
+            return new_periods
+        combined = pd.concat([open_periods, new_periods], ignore_index=True)
+        return combined.groupby(['id', 'start', 'end'], as_index=False).agg(how)
+    
+    def flush(self, watermark: Optional[str] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Emit all complete periods that end on or before the watermark (all periods if None).
+        
+        Closed periods missing daily images are discarded rather than emitted.
+        
+        Returns:
+            Tuple of (pentads with columns ['id', 'system:time_start', 'mean'],
+                      dekads with columns ['id', 'year', 'dekad', 'value', 'rain_days', 'max_dry_spell'])
+        """
+        pentads, self._open_pentads = self._split_closed(self._open_pentads, watermark)
+        dekads, self._open_dekads = self._split_closed(self._open_dekads, watermark)
+        
+        pentad_rows = pd.DataFrame({
+            'id': pentads['id'],
+            'system:time_start': _to_epoch_ms(pentads['start']),
+            'mean': pentads['value'].where(pentads['days'] > 0)
+        })
+        
+        start = dekads['start']
+        dekad_rows = pd.DataFrame({
+            'id': dekads['id'],
+            'year': start.dt.year,
+            'dekad': (start.dt.month - 1) * 3 + (start.dt.day - 1) // 10 + 1,
+            'value': dekads['value'].where(dekads['days'] > 0),
+            'rain_days': dekads['rain_days'].astype(int),
+            'max_dry_spell': dekads['max_dry_spell'].astype(int)
+        })
+        
+        return pentad_rows, dekad_rows
+    
+    @staticmethod
+    def _split_closed(periods: pd.DataFrame, watermark: Optional[str]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        if watermark is None:
+            closed = pd.Series(True, index=periods.index)
+        else:
+            closed = periods['end'] <= pd.Timestamp(watermark)
+        done = periods[closed]
+        done = done[done['images'] >= (done['end'] - done['start']).dt.days]
+        done = done.sort_values(['start', 'id'], ignore_index=True)
+        return done, periods[~closed].reset_index(drop=True)
+
+
+def pentads_to_dekads(records: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sum pentad records into calendar dekads.
+    
+    Pentads starting on days 1/6, 11/16 and 21/26 make up the 1st, 2nd and 3rd dekad
+    of their month, so this works chunk by chunk as long as months are not split.
+    Dekads with only one of their two pentads (at either end of the range) are dropped,
+    as a half total would look like a dry dekad.
+    
+    Args:
+        records: DataFrame with columns ['id', 'system:time_start', 'mean']
+    
+    Returns:
+        DataFrame with columns: [id, year, dekad, value]
+    """
+    date = pd.to_datetime(records['system:time_start'], unit='ms')
+    dekads = pd.DataFrame({
+        'id': records['id'],
+        'year': date.dt.year,
+        'dekad': (date.dt.month - 1) * 3 + (date.dt.day - 1) // 10 + 1,
+        'value': pd.to_numeric(records['mean'], errors='coerce')
+    })
+    groups = dekads.groupby(['id', 'year', 'dekad'], as_index=False)
+    totals = groups['value'].sum(min_count=1)
+    return totals[groups.size()['size'] == 2].reset_index(drop=True)
+
+
+def iter_chirps_chunks(
+    product: str,
+    stream,
+    wet_day_threshold: float = 1.0,
+    aggregator: Optional[DailyAggregator] = None
+):
+    """
+    Turn a stream of raw records into (pentad_records, dekad_records) per window.
+    
+    Args:
+        product: "pentad" or "daily" - the product the stream delivers
+        stream: Iterator of (window_end, records) from stream_pentad_chirps,
+            stream_daily_chirps or stream_local_chirps
+        wet_day_threshold: Daily rainfall (mm) counted as a rain day (daily product only)
+        aggregator: DailyAggregator to fold daily records into, e.g. one carrying dry
+            spells from an earlier run (daily product only; a new one by default)
+    
+    Pentad records have columns ['id', 'system:time_start', 'mean']; dekad records have
+    [id, year, dekad, value] (plus rain_days and max_dry_spell for the daily product).
+    Nothing but the current window and open periods is held in memory.
+    """
+    if product == 'daily':
+        if aggregator is None:
+            aggregator = DailyAggregator(wet_day_threshold=wet_day_threshold)
+        for window_end, chunk in stream:
+            aggregator.update(chunk)
+            yield aggregator.flush(window_end)
+        yield aggregator.flush()
+    else:
+        for _, chunk in stream:
+            yield chunk, pentads_to_dekads(chunk)
+
+
+def _admin_attributes(gdf: gpd.GeoDataFrame) -> pd.DataFrame:
+    """Admin attributes without geometry, keyed by the Earth Engine feature id (the gdf index)."""
+    attributes = pd.DataFrame(gdf.drop(columns='geometry'))
+    attributes['id'] = gdf.index.astype(str)
+    return attributes
+
+
+def _join_attributes(records: pd.DataFrame, attributes: pd.DataFrame) -> pd.DataFrame:
+    """Slim records with the admin attributes, system:index and .geo of an Earth Engine table."""
+    rows = records.merge(attributes, on='id', how='left')
+    date_str = pd.to_datetime(rows['system:time_start'], unit='ms').dt.strftime('%Y%m%d')
+    rows['system:index'] = date_str + '_' + rows['id']
+    rows['.geo'] = json.dumps(None)  # Earth Engine exports geometry-less features as null
+    return rows
+
+
+def _format_records(
+    records: pd.DataFrame,
+    attributes: pd.DataFrame,
+    admin_field: str,
+    admin_code_field: str
+) -> pd.DataFrame:
+    """Join admin attributes back onto slim records and format them to the chirps_raw.csv schema."""
+    rows = _join_attributes(records, attributes)
+    return format_output_dataframe(rows, admin_field, admin_code_field, preserve_full_format=True)
+
+
+class ChunkedCsvWriter:
+    """
+    Append-capable CSV writer for streamed pipeline outputs.
+    
+    Chunks go to a temp file next to each output: the first chunk fixes the columns
+    (and writes the header, even without rows), later chunks are appended in the same
+    column order. commit() then swaps all files in with os.replace, so a failed run
+    leaves the previous outputs untouched; discard() removes the temp files.
+    """
+    
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.rows = {}
+        self._columns = {}
+        os.makedirs(output_dir, exist_ok=True)
+    
+    def path(self, filename: str) -> str:
+        return os.path.join(self.output_dir, filename)
+    
+    def _tmp_path(self, filename: str) -> str:
+        return f"{self.path(filename)}.{os.getpid()}.tmp"
+    
+    def write(self, filename: str, df: pd.DataFrame) -> None:
+        if filename not in self._columns:
+            self._columns[filename] = list(df.columns)
+            self.rows[filename] = 0
+            df.to_csv(self._tmp_path(filename), index=False)
+        else:
+            df = df.reindex(columns=self._columns[filename])
+            df.to_csv(self._tmp_path(filename), mode='a', header=False, index=False)
+        self.rows[filename] += len(df)
+    
+    def commit(self) -> None:
+        for filename in self._columns:
+            os.replace(self._tmp_path(filename), self.path(filename))
+        self._columns = {}
+    
+    def discard(self) -> None:
+        for filename in self._columns:
+            if os.path.exists(self._tmp_path(filename)):
+                os.remove(self._tmp_path(filename))
+        self._columns = {}
+
+
+def pentad_axis(start_date: str, end_date: str) -> np.ndarray:
+    """'system:time_start' of every pentad overlapping [start_date, end_date), from the calendar alone."""
+    days = pd.Series(pd.date_range(start_date, end_date, inclusive='left'))
+    starts, _ = _period_bounds(days, 5, 6)
+    return _to_epoch_ms(starts.drop_duplicates()).to_numpy(dtype='int64')
+
+
+ARRAY_FORMATS = ('auto', 'zarr', 'npy')
+
+
+class ArrayOutput:
+    """
+    Pentad records as dense (gid, time) float32 arrays, filled in as chunks arrive.
+    
+    Both axes are fixed up front: one row per admin feature and one column per pentad
+    of the requested range. Each stat is written to its own array:
+    
+    - zarr (used by 'auto' when installed): <array_dir>/<stat>, chunked and compressed,
+      so one district's history or one pentad across all districts is a few chunk reads
+    - npy: <array_dir>/<stat>.npy written through a memory map (uncompressed, row-major,
+      so a district's history is contiguous); open with np.load(mmap_mode='r')
+    
+    <array_dir>/index.json holds the gid and time coordinates. Missing values are NaN.
+    
+    Zarr writes are buffered per time chunk (all gids x chunk_times columns) and each
+    chunk is stored once, when records move past it or on close(), instead of being
+    recompressed for every streamed window.
+    """
+    
+    def __init__(
+        self,
+        array_dir: str,
+        ids,
+        gids,
+        times: np.ndarray,
+        stats: Optional[List[str]] = None,
+        array_format: str = 'auto',
+        product: str = 'pentad'
+    ):
+        if array_format not in ARRAY_FORMATS:
+            raise ValueError(f"Unknown array format '{array_format}'. Choose from: {list(ARRAY_FORMATS)}")
+        zarr = None
+        if array_format != 'npy':
+            try:
+                import zarr
+            except ImportError:
+                if array_format == 'zarr':
+                    raise ImportError("Zarr output requires zarr: pip3 install zarr")
+        self.array_format = 'zarr' if zarr is not None else 'npy'
+        self.array_dir = array_dir
+        self.times = np.asarray(times, dtype='int64')
+        self.row_by_id = pd.Series(np.arange(len(ids)), index=pd.Index(ids).astype(str))
+        self.records = 0
+        os.makedirs(array_dir, exist_ok=True)
+        
+        shape = (len(self.row_by_id), len(self.times))
+        chunks = (max(min(shape[0], 128), 1), max(min(shape[1], 288), 1))
+        self.chunk_times = chunks[1]
+        self._pending = {}  # time chunk -> {stat: (gids, chunk_times) buffer}, zarr only
+        self._flushed = set()
+        self.arrays = {}
+        for stat in stats or ['mean']:
+            if zarr is not None:
+                self.arrays[stat] = zarr.open_array(
+                    store=os.path.join(array_dir, stat), mode='w',
+                    shape=shape, chunks=chunks, dtype='float32', fill_value=np.nan
+                )
+            else:
+                array = np.lib.format.open_memmap(os.path.join(array_dir, f"{stat}.npy"), mode='w+', dtype='float32', shape=shape)
+                array[:] = np.nan
+                self.arrays[stat] = array
+        
+        _write_json_atomic(os.path.join(array_dir, "index.json"), {
+            'format': self.array_format,
+            'product': product,
+            'stats': list(self.arrays),
+            'shape': list(shape),
+            'chunks': list(chunks) if zarr is not None else None,
+            'gids': [str(gid) for gid in gids],
+            'times': self.times.tolist(),
+            'dates': pd.to_datetime(self.times, unit='ms').strftime('%Y-%m-%d').tolist()
+        })
+    
+    def write(self, records: pd.DataFrame) -> None:
+        """Place records (columns 'id', 'system:time_start' and the stats) into the arrays."""
+        if len(records) == 0:
+            return
+        rows = self.row_by_id.reindex(records['id'].astype(str)).to_numpy()
+        times = records['system:time_start'].to_numpy(dtype='int64')
+        cols = np.searchsorted(self.times, times).clip(0, max(len(self.times) - 1, 0))
+        valid = ~np.isnan(rows) & (self.times[cols] == times) if len(self.times) else np.zeros(len(rows), bool)
+        if not valid.any():
+            return
+        rows, cols = rows[valid].astype('int64'), cols[valid]
+        self.records += int(valid.sum())
+        
+        if self.array_format == 'npy':
+            for stat, array in self.arrays.items():
+                array[rows, cols] = records[stat].to_numpy(dtype='float32')[valid]
+            return
+        
+        time_chunks = cols // self.chunk_times
+        for time_chunk in np.unique(time_chunks):
+            in_chunk = time_chunks == time_chunk
+            buffers = self._buffer(int(time_chunk))
+            for stat, buffer in buffers.items():
+                values = records[stat].to_numpy(dtype='float32')[valid][in_chunk]
+                buffer[rows[in_chunk], cols[in_chunk] - time_chunk * self.chunk_times] = values
+        
+        # Records arrive in time order, so chunks before this window are complete
+        for time_chunk in [chunk for chunk in self._pending if chunk < time_chunks.min()]:
+            self._flush(time_chunk)
+    
+    def _buffer(self, time_chunk: int) -> dict:
+        if time_chunk not in self._pending:
+            col0 = time_chunk * self.chunk_times
+            col1 = min(col0 + self.chunk_times, len(self.times))
+            if time_chunk in self._flushed:
+                # Out-of-order records for a stored chunk: start from what is on disk
+                self._pending[time_chunk] = {stat: array[:, col0:col1] for stat, array in self.arrays.items()}
+            else:
+                self._pending[time_chunk] = {
+                    stat: np.full((len(self.row_by_id), col1 - col0), np.nan, dtype='float32')
+                    for stat in self.arrays
+                }
+        return self._pending[time_chunk]
+    
+    def _flush(self, time_chunk: int) -> None:
+        col0 = time_chunk * self.chunk_times
+        for stat, buffer in self._pending.pop(time_chunk).items():
+            self.arrays[stat][:, col0:col0 + buffer.shape[1]] = buffer
+        self._flushed.add(time_chunk)
+    
+    def close(self) -> str:
+        """Write any buffered chunks and flush memory maps; returns the path of index.json."""
+        for time_chunk in list(self._pending):
+            self._flush(time_chunk)
+        for array in self.arrays.values():
+            if isinstance(array, np.memmap):
+                array.flush()
+        return os.path.join(self.array_dir, "index.json")
+
+
+def rebuild_array_output(
+    output_dir: str,
+    array_dir: str,
+    product: str = 'pentad',
+    array_format: str = 'auto',
+    chunksize: int = 200000
+) -> str:
+    """
+    Rebuild the array output from a finished chirps_raw.csv, reading it in chunks.
+    
+    Used by serve-refresh, whose pipeline runs only cover the refreshed tail.
+    
+    Returns:
+        Path to index.json
+    """
+    chirps_path = os.path.join(output_dir, "chirps_raw.csv")
+    header = pd.read_csv(chirps_path, nrows=0).columns
+    stats = [stat for stat in STAT_REDUCERS if stat in header]
+    
+    # First pass: the gid and time axes
+    gid_by_id = {}
+    first, last = None, None
+    for chunk in pd.read_csv(chirps_path, usecols=['id', 'ADM2_CODE', 'system:time_start'],
+                             dtype={'id': str, 'ADM2_CODE': str}, chunksize=chunksize):
+        gid_by_id.update(zip(chunk['id'], chunk['ADM2_CODE']))
+        first = chunk['system:time_start'].min() if first is None else min(first, chunk['system:time_start'].min())
+        last = chunk['system:time_start'].max() if last is None else max(last, chunk['system:time_start'].max())
+    if first is None:
+        raise ValueError(f"{chirps_path} has no records")
+    
+    axis = pentad_axis(pd.to_datetime(first, unit='ms'), pd.to_datetime(last, unit='ms') + pd.Timedelta(days=1))
+    arrays = ArrayOutput(array_dir, list(gid_by_id), list(gid_by_id.values()), axis, stats, array_format, product)
+    
+    # Second pass: the values
+    for chunk in pd.read_csv(chirps_path, usecols=['id', 'system:time_start'] + stats,
+                             dtype={'id': str}, chunksize=chunksize):
+        arrays.write(chunk)
+    return arrays.close()
+
+
+def process_chirps_pipeline(
+    shapefile_path: Optional[str] = None,
+    country_name: Optional[Union[str, List[str]]] = None,
+    admin_level: int = 2,
+    admin_field: str = "ADM2_NAME",
+    admin_names: Optional[List[str]] = None,
+    country_filter: Optional[str] = None,
+    use_gee_boundaries: bool = False,
+    output_dir: str = "./output",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    early_first: int = 31,
+    early_last: int = 39,
+    late_first: int = 40,
+    late_last: int = 48,
+    product: str = "pentad",
+    wet_day_threshold: float = 1.0,
+    dry_spell: Optional[dict] = None,
+    cache: Optional[QueryCache] = None,
+    max_records_per_request: int = 5000,
+    local_cube: Optional[str] = None,
+    workers: Optional[int] = None,
+    history_path: str = DEFAULT_RUN_HISTORY,
+    stats: Optional[List[str]] = None,
+    points_path: Optional[str] = None,
+    point_id_field: Optional[str] = None,
+    bundle_dir: Optional[str] = None,
+    bundle_format: str = 'json',
+    array_dir: Optional[str] = None,
+    array_format: str = 'auto'
+) -> Tuple[str, str]:
+    """
+    Main pipeline function that processes CHIRPS data from shapefile or GEE boundaries to formatted CSVs.
+    
+    Data is streamed: each date window is fetched, formatted, aggregated to dekads and
+    appended to the outputs before the next one is requested, so peak memory depends on
+    the window size rather than on the number of districts times the date range.
+    
+    Args:
+        shapefile_path: Path to shapefile (optional if use_gee_boundaries=True)
+        country_name: Country name (or list of names) for GEE boundaries (required if use_gee_boundaries=True)
+        admin_level: Admin level for GEE (0=country, 1=province, 2=district)
+        admin_field: Field name containing admin area names (for shapefile mode)
+        admin_names: Optional list of specific admin areas to process
+        country_filter: Optional country name filter (deprecated, use country_name)
+        use_gee_boundaries: If True, load boundaries from GEE instead of shapefile
+        output_dir: Directory to save output files
+        early_first: First dekad of early season
+        early_last: Last dekad of early season
+        late_first: First dekad of late season
+        late_last: Last dekad of late season
+        product: CHIRPS product to use ("pentad" or "daily")
+        wet_day_threshold: Daily rainfall (mm) counted as a rain day (daily product only)
+        dry_spell: Dry days per feature id running into start_date, from an earlier run's
+            dry_spells.json (daily product only; runs start at zero by default)
+        cache: Optional QueryCache for Earth Engine results
+        max_records_per_request: Upper bound on (image, feature) records per Earth Engine request
+        local_cube: Path to a LocalCube (.npy) - reduce locally instead of on Earth Engine
+        workers: Number of worker processes for local reduction (default: all cores)
+        history_path: Run history used to calibrate the download plan (appended to after the run)
+        stats: Extra per-polygon statistics (min, max, stdDev, count) over the native CHIRPS
+            pixels inside each polygon, fetched in the same requests as the mean; each
+            becomes its own chirps_raw.csv column (pentad product only)
+        points_path: CSV of stations/points (lon/lat columns) to extract instead of admin
+            polygons; each point gets the value of the CHIRPS cell containing it
+        point_id_field: Column of points_path holding the station id
+        bundle_dir: Also write per-gid bundles and a manifest.json here for the website
+        bundle_format: Bundle encoding: 'json' (gzip), 'br' (brotli) or 'f32' (binary)
+        array_dir: Also write the pentad records as (gid, time) arrays here (see ArrayOutput)
+        array_format: 'auto' (zarr if installed, else npy), 'zarr' or 'npy'
+    
+    Returns:
+        Tuple of (chirps_csv_path, admin_csv_path)
+    """
+    if product not in CHIRPS_COLLECTIONS:
+        raise ValueError(f"Unknown CHIRPS product '{product}'. Choose from: {list(CHIRPS_COLLECTIONS)}")
+    stats = _normalize_stats(stats)
+    if product == 'daily' and stats != ['mean']:
+        raise ValueError("--stats is only supported for the pentad product (daily data is aggregated from means)")
+    if points_path and stats != ['mean']:
+        raise ValueError("--stats summarises polygons; --points extracts a single cell value per point")
+    if bundle_dir:
+        _bundle_encoder(bundle_format)  # Fail before the download on a bad format or missing brotli
+    if array_dir and array_format not in ARRAY_FORMATS:
+        raise ValueError(f"Unknown array format '{array_format}'. Choose from: {list(ARRAY_FORMATS)}")
+    
+    # Earth Engine is only needed for GEE boundaries or remote reduction
+    if (use_gee_boundaries and not points_path) or not local_cube:
+        initialize_earth_engine()
+    
+    if points_path:
+        gdf, admin_field_used, admin_code_field = load_points(points_path, point_id_field)
+    else:
+        gdf, admin_field_used, admin_code_field = prepare_admin_boundaries(
+            shapefile_path=shapefile_path,
+            country_name=country_name,
+            admin_level=admin_level,
+            admin_field=admin_field,
+            admin_names=admin_names,
+            country_filter=country_filter,
+            use_gee_boundaries=use_gee_boundaries
+        )
+    
+    run_stats = RunStats()
+    attributes = _admin_attributes(gdf)
+    gid_by_id = attributes.set_index('id')[admin_code_field]
+    
+    chirps_file, dekadal_file, admin_file = "chirps_raw.csv", "chirps_dekadal.csv", "admin_raw.csv"
+    plan = None
+    
+    if local_cube:
+        print(f"\n Step 3: Loading local CHIRPS cube {local_cube}...")
+        cube = LocalCube(local_cube)
+        if cube.product != product:
+            raise ValueError(f"Local cube holds {cube.product} data but --product is {product}")
+        range_start = start_date or pd.to_datetime(cube.times[0], unit='ms').strftime('%Y-%m-%d')
+        range_end = end_date or (pd.to_datetime(cube.times[-1], unit='ms') + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        if points_path:
+            stream = stream_local_points(cube, gdf, start_date, end_date, max_records_per_request)
+        else:
+            stream = stream_local_chirps(cube, gdf, start_date, end_date, max_records_per_request, workers, stats)
+        strategy = 'local'
+    else:
+        print(f"\n Step 3: Loading CHIRPS {product.upper()} dataset from Earth Engine...")
+        dataset = ee.ImageCollection(CHIRPS_COLLECTIONS[product]).select('precipitation')
+        range_start, range_end = _resolve_date_range(dataset, start_date, end_date)
+        print(f"   CHIRPS data range: {range_start} to {range_end} (exclusive)")
+        
+        if points_path:
+            stream = stream_gee_points(gdf, product, range_start, range_end, max_records_per_request, cache, run_stats)
+            strategy = 'points'
+        else:
+            # Decide how to download before any heavy call is made
+            plan = plan_download(
+                product, attributes['id'], range_start, range_end,
+                max_records_per_request=max_records_per_request,
+                history_path=history_path,
+                stats=stats
+            )
+            print_plan(plan)
+            strategy = plan['strategy']
+            
+            reduction = ZonalReduction(gdf, page_size=plan['page_size'], stats=stats)
+            if reduction.small_count:
+                print(f"   {reduction.small_count} small admin areas will be reduced at {reduction.small_polygon_scale:.0f} m")
+            
+            stream_chirps = stream_daily_chirps if product == 'daily' else stream_pentad_chirps
+            stream = stream_chirps(reduction, range_start, range_end, max_records_per_request, cache, run_stats)
+    
+    arrays = None
+    if array_dir:
+        arrays = ArrayOutput(
+            array_dir, attributes['id'], attributes[admin_code_field],
+            pentad_axis(range_start, range_end), stats, array_format, product
+        )
+    
+    aggregator = None
+    if product == 'daily':
+        aggregator = DailyAggregator(wet_day_threshold=wet_day_threshold, dry_spell=dry_spell)
+    
+    # Outputs are written to temp files and only replace the previous ones once complete
+    writer = ChunkedCsvWriter(output_dir)
+    try:
+        print("\n Step 4: Streaming spatial averages to the output files (this may take several minutes)...")
+        for pentads, dekads in iter_chirps_chunks(product, stream, wet_day_threshold, aggregator):
+            writer.write(chirps_file, _format_records(pentads, attributes, admin_field_used, admin_code_field))
+            if arrays is not None:
+                arrays.write(pentads)
+            dekads = dekads.assign(gid=dekads['id'].map(gid_by_id)).drop(columns=['id'])
+            writer.write(dekadal_file, dekads)
+        if chirps_file not in writer.rows:
+            # Nothing in the date range: the outputs are still replaced, with headers only
+            empty = pd.DataFrame(columns=['id', 'system:time_start'] + stats)
+            writer.write(chirps_file, _format_records(empty, attributes, admin_field_used, admin_code_field))
+            writer.write(dekadal_file, pentads_to_dekads(empty).rename(columns={'id': 'gid'})[['year', 'dekad', 'value', 'gid']])
+        
+        print(f"   ✓ Wrote {writer.rows[chirps_file]} pentad records and {writer.rows[dekadal_file]} dekadal records")
+        if cache is not None:
+            print(f"   Query cache: {cache.hits} hits, {cache.misses} misses ({cache.cache_dir})")
+        
+        # Admin defaults only need the boundaries, not the rainfall records
+        df_admin = create_admin_defaults(
+            attributes,
+            admin_field_used,
+            admin_code_field,
+            early_first=early_first,
+            early_last=early_last,
+            late_first=late_first,
+            late_last=late_last
+        )
+        writer.write(admin_file, df_admin)
+        writer.commit()
+    except BaseException:
+        writer.discard()
+        raise
+    
+    chirps_path = writer.path(chirps_file)
+    admin_path = writer.path(admin_file)
+    print(f"\n💾 Saved output files:")
+    print(f"   ✓ {chirps_path}")
+    print(f"   ✓ {writer.path(dekadal_file)}")
+    print(f"   ✓ {admin_path}")
+    if aggregator is not None:
+        dry_spell_path = os.path.join(output_dir, "dry_spells.json")
+        _write_json_atomic(dry_spell_path, aggregator.month_start_dry_spells)
+        print(f"   ✓ {dry_spell_path}")
+    
+    if arrays is not None:
+        print(f"   ✓ {arrays.close()} ({arrays.array_format}, {arrays.records} pentad values)")
+    if bundle_dir:
+        print(f"   ✓ {write_district_bundles(SeriesIndex([output_dir], load_pentads=False), bundle_dir, bundle_format)}")
+    
+    report = {
+        'timestamp': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'source': 'local' if local_cube else 'gee_points' if points_path else 'gee',
+        'product': product,
+        'stats': stats,
+        'strategy': strategy,
+        'feature_count': len(gdf),
+        'records_written': writer.rows.get(chirps_file, 0),
+        'requests': run_stats.requests,
+        'cached_requests': run_stats.cached_requests,
+        'fetched_records': run_stats.fetched_records,
+        'fetched_bytes': run_stats.fetched_bytes,
+        'fetch_seconds': round(run_stats.fetch_seconds, 3),
+        'wall_seconds': round(time.time() - run_stats.started, 3),
+        'estimated_record_bytes': plan['estimated_record_bytes'] if plan else None,
+        'plan': plan
+    }
+    print(f"   ✓ {write_run_report(report, output_dir, history_path)}")
+    
+    print(f"\n✅ Pipeline complete! Output files saved to {output_dir}")
+    
+    return chirps_path, admin_path
+
+
+def latest_image_time(product: str = "pentad") -> int:
+    """Cheap poll: 'system:time_start' (ms) of the newest image in a CHIRPS collection."""
+    dataset = ee.ImageCollection(CHIRPS_COLLECTIONS[product])
+    return int(ee.Image(dataset.limit(1, 'system:time_start', False).first()).get('system:time_start').getInfo())
+
+
+def _write_json_atomic(path: str, data: dict) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _last_time_in_output(chirps_path: str) -> Optional[int]:
+    """Newest 'system:time_start' in an existing chirps_raw.csv (read in chunks)."""
+    if not os.path.exists(chirps_path):
+        return None
+    latest = None
+    for chunk in pd.read_csv(chirps_path, usecols=['system:time_start'], chunksize=500_000):
+        if len(chunk):
+            chunk_max = int(chunk['system:time_start'].max())
+            latest = chunk_max if latest is None else max(latest, chunk_max)
+    return latest
+
+
+def _is_built_past(output_dir: str, end_ms: int) -> bool:
+    """True if output_dir holds a chirps_raw.csv refreshed from images up to (or past) end_ms."""
+    state_path = os.path.join(output_dir, "refresh_state.json")
+    if not (os.path.exists(os.path.join(output_dir, "chirps_raw.csv")) and os.path.exists(state_path)):
+        return False
+    with open(state_path) as f:
+        state = json.load(f)
+    return (state.get('last_source_time') or 0) >= end_ms
+
+
+def _matching_columns(path: str, new_path: str) -> List[str]:
+    """Columns of the existing output path, after checking that new_path has exactly those."""
+    new_columns = list(pd.read_csv(new_path, nrows=0).columns)
+    if not os.path.exists(path):
+        return new_columns
+    columns = list(pd.read_csv(path, nrows=0).columns)
+    missing = [column for column in columns if column not in new_columns]
+    extra = [column for column in new_columns if column not in columns]
+    if missing or extra:
+        raise ValueError(
+            f"Refreshed rows for {path} do not match its columns (missing: {missing}, unexpected: {extra}); "
+            f"delete the output to rebuild it"
+        )
+    return columns
+
+
+def _merge_tail(path: str, new_path: str, keep) -> None:
+    """
+    Atomically replace path with its rows for which keep(chunk) is True plus all rows of new_path.
+    
+    Both files are streamed in chunks, and the result is swapped in with os.replace, so
+    readers never see a half-written output. New rows are written in the column order of
+    the existing file; a refresh whose columns differ (e.g. the job's --stats changed)
+    fails before anything is written.
+    
+    Cells are read and written back as text (keep gets string columns), so codes such as
+    "01001" and the formatting of untouched rows survive the merge unchanged.
+    """
+    columns = _matching_columns(path, new_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    header = True
+    text = dict(dtype=str, keep_default_na=False, chunksize=500_000)
+    if os.path.exists(path):
+        for chunk in pd.read_csv(path, **text):
+            chunk[keep(chunk)].to_csv(tmp_path, mode='w' if header else 'a', header=header, index=False)
+            header = False
+    for chunk in pd.read_csv(new_path, **text):
+        chunk[columns].to_csv(tmp_path, mode='w' if header else 'a', header=header, index=False)
+        header = False
+    os.replace(tmp_path, path)
+
+
+def _carried_dry_spell(output_dir: str, month_start: str) -> Optional[dict]:
+    """Dry days per feature id running into month_start, as saved in dry_spells.json by the previous run."""
+    path = os.path.join(output_dir, "dry_spells.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            month_starts = json.load(f)
+        if month_start in month_starts:
+            return month_starts[month_start]
+    print(f"   ⚠️  No dry spell saved for {month_start} in {output_dir}; dry spells restart at zero there")
+    return None
+
+
+def refresh_job(job: dict, latest: int, cache: Optional[QueryCache] = None) -> dict:
+    """
+    Bring one job's outputs up to the newest CHIRPS image.
+    
+    Only the month containing the first missing image onwards is fetched (so dekads are
+    recomputed whole), the new rows replace that tail of chirps_raw.csv and
+    chirps_dekadal.csv, and refresh_state.json records what was done.
+    
+    Freshness is judged by last_source_time, the newest collection image the outputs
+    were built from. The output's own last_time_start can't be used for that: for the
+    daily product it is the start of the last pentad, which is behind the newest image.
+    
+    Daily jobs resume their dry spells from the dry_spells.json of the previous run, so
+    max_dry_spell is the same as in a full run.
+    
+    Args:
+        job: process_chirps_pipeline keyword arguments (output_dir required); "name" is optional
+        latest: 'system:time_start' of the newest image in the collection
+        cache: Optional QueryCache
+    
+    Returns:
+        The updated refresh state
+    """
+    output_dir = job['output_dir']
+    state_path = os.path.join(output_dir, "refresh_state.json")
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+    
+    chirps_path = os.path.join(output_dir, "chirps_raw.csv")
+    last, last_source = None, None
+    if os.path.exists(chirps_path):
+        last = state.get('last_time_start') or _last_time_in_output(chirps_path)
+        last_source = state.get('last_source_time')
+        if last_source is None and job.get('product', 'pentad') == 'pentad':
+            last_source = last  # Pentad output times are the image times
+    state['latest_available'] = latest
+    if last_source is not None and last_source >= latest:
+        state['last_time_start'] = last
+        state['last_source_time'] = last_source
+        _write_json_atomic(state_path, state)
+        return state
+    
+    kwargs = {key: value for key, value in job.items() if key != 'name'}
+    # Bundles are rebuilt from the merged outputs, not from the refreshed tail
+    bundle_dir = kwargs.pop('bundle_dir', None)
+    bundle_format = kwargs.pop('bundle_format', 'json')
+    array_dir = kwargs.pop('array_dir', None)
+    array_format = kwargs.pop('array_format', 'auto')
+    if last is not None:
+        first_missing = pd.to_datetime(last, unit='ms') + pd.Timedelta(days=1)
+        cutoff = first_missing.to_period('M').start_time
+        kwargs['start_date'] = cutoff.strftime('%Y-%m-%d')
+        if job.get('product', 'pentad') == 'daily':
+            kwargs['dry_spell'] = _carried_dry_spell(output_dir, kwargs['start_date'])
+    
+    tmp_dir = os.path.join(output_dir, ".refresh")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    kwargs['output_dir'] = tmp_dir
+    process_chirps_pipeline(cache=cache, **kwargs)
+    
+    if last is None:
+        for filename in ("chirps_raw.csv", "chirps_dekadal.csv"):
+            os.replace(os.path.join(tmp_dir, filename), os.path.join(output_dir, filename))
+    else:
+        cutoff_ms = _date_to_ms(cutoff)
+        cutoff_dekad = cutoff.year * 100 + (cutoff.month - 1) * 3 + 1
+        # Check both files first so a mismatch never leaves one merged and the other not
+        for filename in ("chirps_raw.csv", "chirps_dekadal.csv"):
+            _matching_columns(os.path.join(output_dir, filename), os.path.join(tmp_dir, filename))
+        _merge_tail(chirps_path, os.path.join(tmp_dir, "chirps_raw.csv"),
+                    lambda chunk: pd.to_numeric(chunk['system:time_start']) < cutoff_ms)
+        _merge_tail(os.path.join(output_dir, "chirps_dekadal.csv"), os.path.join(tmp_dir, "chirps_dekadal.csv"),
+                    lambda chunk: pd.to_numeric(chunk['year']) * 100 + pd.to_numeric(chunk['dekad']) < cutoff_dekad)
+    for filename in ("admin_raw.csv", "run_report.json", "dry_spells.json"):
+        if os.path.exists(os.path.join(tmp_dir, filename)):
+            os.replace(os.path.join(tmp_dir, filename), os.path.join(output_dir, filename))
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    if bundle_dir:
+        write_district_bundles(SeriesIndex([output_dir], load_pentads=False), bundle_dir, bundle_format)
+    if array_dir:
+        rebuild_array_output(output_dir, array_dir, job.get('product', 'pentad'), array_format)
+    
+    with open(os.path.join(output_dir, "run_report.json")) as f:
+        report = json.load(f)
+    state.update({
+        'last_time_start': _last_time_in_output(chirps_path),
+        'last_source_time': latest,
+        'last_refresh': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'refetched_from': kwargs.get('start_date'),
+        'records_refetched': report['records_written'],
+        'last_error': None
+    })
+    _write_json_atomic(state_path, state)
+    return state
+
+
+def serve_refresh(
+    jobs_path: str,
+    poll_minutes: float = 60,
+    cache: Optional[QueryCache] = None,
+    once: bool = False
+) -> None:
+    """
+    Long-running refresh loop for a set of pipeline jobs.
+    
+    Every poll_minutes the newest CHIRPS image date is looked up (a single metadata
+    call per product); jobs are only re-run when it has moved past what their outputs
+    hold, and then only for the new months. Each job's refresh_state.json shows when
+    it was last refreshed and up to which image.
+    
+    Args:
+        jobs_path: JSON file with a list of jobs (process_chirps_pipeline keyword arguments,
+            each with an output_dir and optionally a name)
+        poll_minutes: Minutes between polls
+        cache: Optional QueryCache shared by all jobs
+        once: Poll and refresh a single time, then return (for testing / cron-style use)
+    """
+    with open(jobs_path) as f:
+        jobs = json.load(f)
+    for job in jobs:
+        if 'output_dir' not in job:
+            raise ValueError(f"Job {job.get('name', job)} has no output_dir")
+        if job.get('local_cube'):
+            raise ValueError(f"Job {job.get('name', job['output_dir'])}: serve-refresh polls Earth Engine, not local cubes")
+    
+    initialize_earth_engine()
+    print(f"\n🔁 Serving refreshes for {len(jobs)} jobs (polling every {poll_minutes:g} min)")
+    
+    while True:
+        latest_by_product = {}
+        for job in jobs:
+            name = job.get('name', job['output_dir'])
+            product = job.get('product', 'pentad')
+            try:
+                if product not in latest_by_product:
+                    latest_by_product[product] = latest_image_time(product)
+                latest = latest_by_product[product]
+                
+                if job.get('end_date') and _is_built_past(job['output_dir'], _date_to_ms(job['end_date'])):
+                    continue  # Fixed historical range, already built - nothing new can appear
+                
+                state = refresh_job(job, latest, cache)
+                print(f"   {name}: up to {pd.to_datetime(state.get('last_time_start'), unit='ms'):%Y-%m-%d} "
+                      f"(last refresh: {state.get('last_refresh')})")
+            except Exception as e:
+                print(f"   ❌ {name}: {e}")
+                state_path = os.path.join(job['output_dir'], "refresh_state.json")
+                if os.path.isdir(job['output_dir']):
+                    state = {}
+                    if os.path.exists(state_path):
+                        with open(state_path) as f:
+                            state = json.load(f)
+                    state['last_error'] = f"{pd.Timestamp.now().isoformat(timespec='seconds')}: {e}"
+                    _write_json_atomic(state_path, state)
+        
+        if once:
+            return
+        time.sleep(poll_minutes * 60)
+
+
+def _dekad_to_ms(years, dekads) -> np.ndarray:
+    """Epoch milliseconds of the first day of each (year, dekad of the year)."""
+    years = np.asarray(years, dtype='int64')
+    dekads = np.asarray(dekads, dtype='int64')
+    starts = pd.to_datetime(pd.DataFrame({
+        'year': years,
+        'month': (dekads - 1) // 3 + 1,
+        'day': (dekads - 1) % 3 * 10 + 1
+    }))
+    return _to_epoch_ms(starts).to_numpy(dtype='int64')
+
+
+class SeriesIndex:
+    """
+    In-memory index of pipeline outputs, keyed by gid.
+    
+    Each gid holds time-sorted (epoch ms, float32 value) arrays for its pentad and
+    dekad series, so a date range is two np.searchsorted calls however many
+    districts or countries are loaded. Season ranges come from admin_raw.csv.
+    
+    With load_pentads=False only chirps_dekadal.csv is read, which is far smaller
+    than chirps_raw.csv.
+    """
+    
+    def __init__(self, output_dirs: List[str], load_pentads: bool = True):
+        pentads, dekads, admins = [], [], []
+        for output_dir in output_dirs:
+            if load_pentads:
+                pentads.append(pd.read_csv(
+                    os.path.join(output_dir, "chirps_raw.csv"),
+                    usecols=['ADM2_CODE', 'system:time_start', 'mean'],
+                    dtype={'ADM2_CODE': str}
+                ).rename(columns={'ADM2_CODE': 'gid', 'system:time_start': 'time', 'mean': 'value'}))
+            
+            dekadal = pd.read_csv(
+                os.path.join(output_dir, "chirps_dekadal.csv"),
+                usecols=['gid', 'year', 'dekad', 'value'],
+                dtype={'gid': str}
+            )
+            dekadal['time'] = _dekad_to_ms(dekadal['year'], dekadal['dekad'])
+            dekads.append(dekadal[['gid', 'time', 'value']])
+            
+            admins.append(pd.read_csv(os.path.join(output_dir, "admin_raw.csv"), dtype={'gid': str}))
+        
+        self.series_by_agg = {'dekad': self._group(pd.concat(dekads, ignore_index=True))}
+        if load_pentads:
+            self.series_by_agg['pentad'] = self._group(pd.concat(pentads, ignore_index=True))
+        self.admin = pd.concat(admins, ignore_index=True).drop_duplicates('gid', keep='last').set_index('gid')
+    
+    @staticmethod
+    def _group(records: pd.DataFrame) -> dict:
+        """Split records into gid -> (times, values) arrays; later output dirs win on duplicates."""
+        records = records.drop_duplicates(['gid', 'time'], keep='last').sort_values(['gid', 'time'])
+        gids, starts = np.unique(records['gid'].to_numpy(), return_index=True)
+        times = records['time'].to_numpy(dtype='int64')
+        values = records['value'].to_numpy(dtype='float32')
+        bounds = list(starts[1:]) + [len(records)]
+        return {
+            gid: (times[start:stop], values[start:stop])
+            for gid, start, stop in zip(gids, starts, bounds)
+        }
+    
+    @property
+    def gids(self) -> List[str]:
+        return sorted(set().union(*(series.keys() for series in self.series_by_agg.values())))
+    
+    def series(
+        self,
+        gid: str,
+        agg: str = 'dekad',
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Times (epoch ms) and values of one gid's series between start_date and end_date (inclusive).
+        
+        Raises:
+            KeyError: Unknown gid or agg
+        """
+        times, values = self.series_by_agg[agg][gid]
+        start = 0 if start_date is None else np.searchsorted(times, _date_to_ms(start_date), side='left')
+        stop = len(times) if end_date is None else np.searchsorted(times, _date_to_ms(end_date), side='right')
+        return times[start:stop], values[start:stop]
+    
+    def season_totals(self, gid: str, first_year: Optional[int] = None, last_year: Optional[int] = None) -> List[dict]:
+        """
+        Early and late season rainfall totals per season start year.
+        
+        Season dekads follow admin_raw.csv: dekads past 36 fall in the following year
+        (e.g. 31-39 runs from late October to the end of January). Seasons with a
+        missing dekad total to None.
+        """
+        times, values = self.series_by_agg['dekad'][gid]
+        defaults = self.admin.loc[gid]
+        if len(times) == 0:
+            return []
+        dates = pd.to_datetime(times, unit='ms')
+        absolute = dates.year.to_numpy() * 36 + (dates.month.to_numpy() - 1) * 3 + (dates.day.to_numpy() - 1) // 10
+        
+        # Dense absolute-dekad arrays so every season total is a cumulative-sum difference
+        origin = absolute.min()
+        dense = np.full(absolute.max() - origin + 1, np.nan)
+        dense[absolute - origin] = values
+        present = np.concatenate([[0], np.cumsum(~np.isnan(dense))])
+        totals = np.concatenate([[0.0], np.cumsum(np.nan_to_num(dense))])
+        
+        def total(year: int, first: int, last: int) -> Optional[float]:
+            lo, hi = year * 36 + first - 1 - origin, year * 36 + last - origin
+            if lo < 0 or hi > len(dense) or present[hi] - present[lo] != hi - lo:
+                return None
+            return round(float(totals[hi] - totals[lo]), 3)
+        
+        years = range(first_year or dates.year.min(), (last_year or dates.year.max()) + 1)
+        return [
+            {
+                'year': year,
+                'early': total(year, int(defaults['chirps_early_first']), int(defaults['chirps_early_last'])),
+                'late': total(year, int(defaults['chirps_late_first']), int(defaults['chirps_late_last']))
+            }
+            for year in years
+        ]
+
+
+def _series_json(times: np.ndarray, values: np.ndarray) -> dict:
+    """JSON-ready series: ISO dates and values rounded to 0.001 mm (None = missing)."""
+    return {
+        'dates': pd.to_datetime(times, unit='ms').strftime('%Y-%m-%d').tolist(),
+        'values': [None if np.isnan(value) else round(float(value), 3) for value in values]
+    }
+
+
+def _series_f32(times: np.ndarray, values: np.ndarray) -> bytes:
+    """Little-endian binary series: n int32 days since 1970-01-01, then n float32 values."""
+    days = (times // 86400000).astype('<i4')
+    return days.tobytes() + values.astype('<f4').tobytes()
+
+
+class SeriesService:
+    """
+    Query handler behind --serve-series, with an LRU cache of encoded responses.
+    
+    Endpoints:
+        GET /gids                                          all gids with their district names
+        GET /series?gid=..&agg=pentad|dekad&from=..&to=..  one series (dates YYYY-MM-DD, inclusive)
+        GET /seasons?gid=..&from=YYYY&to=YYYY              early/late season totals per year
+    
+    /series takes format=json (default) or format=f32: a little-endian binary of n
+    int32 days since 1970-01-01 followed by n float32 values (NaN = missing).
+    """
+    
+    def __init__(self, index: SeriesIndex, cache_entries: int = 1024):
+        self.index = index
+        self.cache_entries = cache_entries
+        self.responses = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def handle(self, url: str) -> Tuple[int, str, bytes]:
+        """Answer a request path (with query string) as (status, content type, body)."""
+        parsed = urlparse(url)
+        params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        key = (parsed.path, tuple(sorted(params.items())))
+        with self.lock:
+            if key in self.responses:
+                self.responses.move_to_end(key)
+                self.hits += 1
+                return self.responses[key]
+            self.misses += 1
+        
+        try:
+            response = self._respond(parsed.path, params)
+        except KeyError as e:
+            return 404, 'application/json', json.dumps({'error': f"Not found: {e}"}).encode('utf-8')
+        except ValueError as e:
+            return 400, 'application/json', json.dumps({'error': str(e)}).encode('utf-8')
+        
+        with self.lock:
+            self.responses[key] = response
+            if len(self.responses) > self.cache_entries:
+                self.responses.popitem(last=False)
+        return response
+    
+    def _respond(self, path: str, params: dict) -> Tuple[int, str, bytes]:
+        if path == '/gids':
+            districts = self.index.admin['district'] if 'district' in self.index.admin else pd.Series(dtype=str)
+            body = [{'gid': gid, 'district': districts.get(gid)} for gid in self.index.gids]
+            return 200, 'application/json', json.dumps(body).encode('utf-8')
+        
+        if 'gid' not in params:
+            raise ValueError("Missing gid parameter")
+        gid = params['gid']
+        
+        if path == '/series':
+            agg = params.get('agg', 'dekad')
+            if agg not in self.index.series_by_agg:
+                raise ValueError(f"agg must be one of {list(self.index.series_by_agg)}")
+            times, values = self.index.series(gid, agg, params.get('from'), params.get('to'))
+            if params.get('format', 'json') == 'f32':
+                return 200, 'application/octet-stream', _series_f32(times, values)
+            body = {'gid': gid, 'agg': agg, **_series_json(times, values)}
+            return 200, 'application/json', json.dumps(body).encode('utf-8')
+        
+        if path == '/seasons':
+            first_year = int(params['from'][:4]) if 'from' in params else None
+            last_year = int(params['to'][:4]) if 'to' in params else None
+            body = {'gid': gid, 'seasons': self.index.season_totals(gid, first_year, last_year)}
+            return 200, 'application/json', json.dumps(body).encode('utf-8')
+        
+        raise KeyError(path)
+
+
+BUNDLE_FORMATS = ('json', 'br', 'f32')
+SEASON_FIELDS = ['chirps_early_first', 'chirps_early_last', 'chirps_late_first', 'chirps_late_last']
+
+
+def _bundle_encoder(bundle_format: str):
+    """(compress function, file suffix) for a bundle format; compress is None for raw binaries."""
+    if bundle_format not in BUNDLE_FORMATS:
+        raise ValueError(f"Unknown bundle format '{bundle_format}'. Choose from: {list(BUNDLE_FORMATS)}")
+    if bundle_format == 'br':
+        try:
+            import brotli
+        except ImportError:
+            raise ImportError("Brotli bundles require brotli: pip3 install brotli")
+        return (lambda data: brotli.compress(data, quality=11)), '.json.br'
+    if bundle_format == 'json':
+        return (lambda data: gzip.compress(data, compresslevel=9, mtime=0)), '.json.gz'
+    return None, '.f32'
+
+
+def write_district_bundles(index: SeriesIndex, bundle_dir: str, bundle_format: str = 'json') -> str:
+    """
+    Write one small file per gid for the static website, plus manifest.json.
+    
+    - json: gzip-compressed JSON (<gid>.json.gz) with the dekadal series, season
+      defaults and season totals
+    - br: the same JSON brotli-compressed (<gid>.json.br, requires brotli)
+    - f32: the dekadal series as a typed-array binary (<gid>.f32, see _series_f32);
+      season defaults are only in the manifest
+    
+    The manifest lists every gid with its district name, file, size, date range and
+    season defaults, so the front end only fetches the district a user selects.
+    
+    Args:
+        index: SeriesIndex over the pipeline outputs (only the dekad series is used)
+        bundle_dir: Directory for the bundles
+        bundle_format: One of BUNDLE_FORMATS
+    
+    Returns:
+        Path to manifest.json
+    """
+    compress, suffix = _bundle_encoder(bundle_format)
+    
+    print(f"\n📦 Writing {bundle_format} district bundles to {bundle_dir}...")
+    os.makedirs(bundle_dir, exist_ok=True)
+    districts = []
+    for gid, (times, values) in index.series_by_agg['dekad'].items():
+        defaults = {}
+        district = None
+        if gid in index.admin.index:
+            admin = index.admin.loc[gid]
+            defaults = {field: int(admin[field]) for field in SEASON_FIELDS if field in admin}
+            district = admin.get('district')
+        
+        if bundle_format == 'f32':
+            body = _series_f32(times, values)
+        else:
+            payload = {
+                'gid': gid,
+                'district': district,
+                'defaults': defaults,
+                'dekad': _series_json(times, values),
+                'seasons': index.season_totals(gid) if len(defaults) == len(SEASON_FIELDS) else []
+            }
+            body = compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+        
+        filename = re.sub(r'[^A-Za-z0-9_.-]', '_', gid) + suffix
+        # Swap each bundle in whole: the previous manifest keeps pointing at these files
+        path = os.path.join(bundle_dir, filename)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+        districts.append({
+            'gid': gid,
+            'district': district,
+            'file': filename,
+            'bytes': len(body),
+            'dekads': len(times),
+            'first': pd.to_datetime(times[0], unit='ms').strftime('%Y-%m-%d') if len(times) else None,
+            'last': pd.to_datetime(times[-1], unit='ms').strftime('%Y-%m-%d') if len(times) else None,
+            **defaults
+        })
+    
+    manifest = {
+        'format': bundle_format,
+        'generated': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'districts': districts
+    }
+    manifest_path = os.path.join(bundle_dir, "manifest.json")
+    # Written last and atomically, so the site never sees a manifest pointing at missing bundles
+    _write_json_atomic(manifest_path, manifest)
+    print(f"   ✓ {len(districts)} bundles, {sum(d['bytes'] for d in districts) / 1024:.1f} KB in total")
+    return manifest_path
+
+
+def serve_series(
+    output_dirs: List[str],
+    host: str = '127.0.0.1',
+    port: int = 8765,
+    cache_entries: int = 1024
+) -> None:
+    """
+    Serve the pipeline outputs of one or more output directories over HTTP.
+    
+    The CSVs are indexed once at start-up; see SeriesService for the endpoints.
+    
+    Args:
+        output_dirs: Pipeline output directories (chirps_raw.csv, chirps_dekadal.csv, admin_raw.csv)
+        host: Interface to listen on
+        port: Port to listen on
+        cache_entries: Responses kept in the LRU cache
+    """
+    print(f"\n📡 Indexing {len(output_dirs)} output directories...")
+    service = SeriesService(SeriesIndex(output_dirs), cache_entries=cache_entries)
+    print(f"   ✓ {len(service.index.gids)} gids indexed")
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, content_type, body = service.handle(self.path)
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"   Serving on http://{host}:{port} (try /gids, /series?gid=..&agg=dekad)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    """Command-line interface for the CHIRPS pipeline."""
+    parser = argparse.ArgumentParser(
+        description="Download and format CHIRPS rainfall data for DESDR",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Process all admin areas in shapefile:
+  python chirps_pipeline.py --shapefile madagascar.shp
+  
+  # Process specific admin areas:
+  python chirps_pipeline.py --shapefile madagascar.shp --admin-names "Manakara Atsimo,Toliary-I,Toliary-II"
+  
+  # With custom output directory and dekad ranges:
+  python chirps_pipeline.py --shapefile madagascar.shp --output-dir ./data --early-first 31 --early-last 39
+        """
+    )
+    
+    parser.add_argument(
+        '--shapefile',
+        type=str,
+        default=None,
+        help='Path to shapefile containing admin boundaries (optional if using --use-gee-boundaries)'
+    )
+    
+    parser.add_argument(
+        '--use-gee-boundaries',
+        action='store_true',
+        help='Load admin boundaries from Google Earth Engine (GAUL dataset) instead of shapefile'
+    )
+    
+    parser.add_argument(
+        '--country-name',
+        type=str,
         default=None,
-        help='Country name for GEE boundaries (required if --use-gee-boundaries)'
+        help='Country name for GEE boundaries, comma-separated for several countries (required if --use-gee-boundaries)'
     )
     
     parser.add_argument(
@@ -873,6 +3314,166 @@ Examples:
         help='End date for CHIRPS data (YYYY-MM-DD, e.g., "2025-12-31"). Defaults to present.'
     )
     
+    parser.add_argument(
+        '--product',
+        type=str,
+        choices=sorted(CHIRPS_COLLECTIONS),
+        default='pentad',
+        help='CHIRPS product: "pentad" (default) or "daily" (streamed and aggregated to pentads/dekads with rain-day and dry-spell metrics)'
+    )
+    
+    parser.add_argument(
+        '--wet-day-threshold',
+        type=float,
+        default=1.0,
+        help='Daily rainfall in mm that counts as a rain day for --product daily (default: 1.0)'
+    )
+    
+    parser.add_argument(
+        '--max-records-per-request',
+        type=int,
+        default=5000,
+        help='Upper bound on (image, admin area) records fetched per Earth Engine request; bounds peak memory (default: 5000)'
+    )
+    
+    parser.add_argument(
+        '--stats',
+        type=str,
+        default=None,
+        help='Comma-separated extra statistics over the native 0.05° pixels inside each polygon, one column each: '
+             'min,max,stdDev,count (count = pixels with data; pentad product only)'
+    )
+    
+    parser.add_argument(
+        '--serve-refresh',
+        action='store_true',
+        help='Run as a long-lived daemon that polls for new CHIRPS images and refreshes the jobs in --jobs'
+    )
+    
+    parser.add_argument(
+        '--jobs',
+        type=str,
+        default=None,
+        help='JSON list of pipeline jobs for --serve-refresh (process_chirps_pipeline arguments + output_dir)'
+    )
+    
+    parser.add_argument(
+        '--poll-minutes',
+        type=float,
+        default=60,
+        help='Minutes between polls for --serve-refresh (default: 60)'
+    )
+    
+    parser.add_argument(
+        '--serve-series',
+        action='store_true',
+        help='Serve pentad/dekad series and season totals from pipeline outputs over HTTP'
+    )
+    
+    parser.add_argument(
+        '--series-dirs',
+        type=str,
+        default=None,
+        help='Comma-separated output directories for --serve-series (default: --output-dir)'
+    )
+    
+    parser.add_argument(
+        '--host',
+        type=str,
+        default='127.0.0.1',
+        help='Interface for --serve-series (default: 127.0.0.1)'
+    )
+    
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=8765,
+        help='Port for --serve-series (default: 8765)'
+    )
+    
+    parser.add_argument(
+        '--plan', '--dry-run',
+        dest='plan',
+        action='store_true',
+        help='Only print the predicted record count, response size, requests, wall time and download strategy'
+    )
+    
+    parser.add_argument(
+        '--run-history',
+        type=str,
+        default=DEFAULT_RUN_HISTORY,
+        help=f'Run report history used to calibrate --plan (default: {DEFAULT_RUN_HISTORY})'
+    )
+    
+    parser.add_argument(
+        '--points',
+        type=str,
+        default=None,
+        help='CSV of stations/points (lon/lat columns) to extract instead of admin polygons'
+    )
+    
+    parser.add_argument(
+        '--point-id-field',
+        type=str,
+        default=None,
+        help='Column of --points holding the station id (default: id, station_id, station, code or row number)'
+    )
+    
+    parser.add_argument(
+        '--local-cube',
+        type=str,
+        default=None,
+        help='Reduce over a local CHIRPS cube (.npy built with --build-cube) instead of on Earth Engine'
+    )
+    
+    parser.add_argument(
+        '--build-cube',
+        type=str,
+        default=None,
+        help='Glob of CHIRPS GeoTIFFs (e.g. "tifs/chirps-v2.0.*.tif") to stack into --local-cube before running (requires rasterio)'
+    )
+    
+    parser.add_argument(
+        '--cube-bbox',
+        type=str,
+        default=None,
+        help='Crop --build-cube to "minx,miny,maxx,maxy" in degrees'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Worker processes for --local-cube reduction (default: all cores)'
+    )
+    
+    parser.add_argument(
+        '--cache-dir',
+        type=str,
+        default=DEFAULT_CACHE_DIR,
+        help=f'Directory for the on-disk Earth Engine query cache (default: {DEFAULT_CACHE_DIR})'
+    )
+    
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Always recompute queries on Earth Engine instead of using the on-disk cache'
+    )
+    
+    parser.add_argument(
+        '--cache-max-mb',
+        type=float,
+        default=2048,
+        help='Maximum size of the query cache in MB; least recently used entries are evicted (default: 2048)'
+    )
+    
+    parser.add_argument(
+        '--cache-ttl-hours',
+        type=float,
+        default=24,
+        help='Expiry for cached queries covering the still-updating tail of the collection (default: 24)'
+    )
+    
     parser.add_argument(
         '--output-dir',
         type=str,
@@ -880,6 +3481,36 @@ Examples:
         help='Output directory for CSV files (default: ./output)'
     )
     
+    parser.add_argument(
+        '--bundle-dir',
+        type=str,
+        default=None,
+        help='Also write per-district bundles and a manifest.json here for the static website'
+    )
+    
+    parser.add_argument(
+        '--bundle-format',
+        type=str,
+        choices=BUNDLE_FORMATS,
+        default='json',
+        help='District bundle encoding: json (gzip), br (brotli, requires brotli) or f32 (binary) (default: json)'
+    )
+    
+    parser.add_argument(
+        '--array-dir',
+        type=str,
+        default=None,
+        help='Also write pentad rainfall as (gid, time) arrays with a coordinate index here'
+    )
+    
+    parser.add_argument(
+        '--array-format',
+        type=str,
+        choices=ARRAY_FORMATS,
+        default='auto',
+        help='Array storage: zarr (chunked, compressed), npy (memory-mapped) or auto (zarr if installed) (default: auto)'
+    )
+    
     parser.add_argument(
         '--early-first',
         type=int,
@@ -910,14 +3541,42 @@ Examples:
     
     args = parser.parse_args()
     
+    cache = None
+    if not args.no_cache:
+        cache = QueryCache(args.cache_dir, max_size_mb=args.cache_max_mb, ttl_hours=args.cache_ttl_hours)
+    
+    if args.serve_refresh:
+        if not args.jobs:
+            parser.error("--serve-refresh requires --jobs")
+        serve_refresh(args.jobs, poll_minutes=args.poll_minutes, cache=cache)
+        return 0
+    
+    if args.serve_series:
+        series_dirs = [path.strip() for path in args.series_dirs.split(',')] if args.series_dirs else [args.output_dir]
+        serve_series(series_dirs, host=args.host, port=args.port)
+        return 0
+    
     # Validate arguments
-    if args.use_gee_boundaries:
+    if args.points:
+        if args.plan:
+            parser.error("--plan estimates polygon reductions and does not support --points")
+    elif args.use_gee_boundaries:
         if not args.country_name:
             parser.error("--country-name is required when using --use-gee-boundaries")
     else:
         if not args.shapefile:
             parser.error("--shapefile is required when not using --use-gee-boundaries")
     
+    if args.build_cube and not args.local_cube:
+        parser.error("--build-cube requires --local-cube (the output .npy path)")
+    
+    stats = [stat.strip() for stat in args.stats.split(',')] if args.stats else None
+    
+    # Several countries can be loaded from GAUL in one go
+    country_name = args.country_name
+    if country_name and ',' in country_name:
+        country_name = [name.strip() for name in country_name.split(',')]
+    
     # Parse admin names if provided
     admin_names = None
     if args.admin_names:
@@ -925,9 +3584,31 @@ Examples:
     
     # Run pipeline
     try:
+        if args.plan:
+            plan_chirps_pipeline(
+                shapefile_path=args.shapefile,
+                country_name=country_name,
+                admin_level=args.admin_level,
+                admin_field=args.admin_field,
+                admin_names=admin_names,
+                country_filter=args.country_filter,
+                use_gee_boundaries=args.use_gee_boundaries,
+                start_date=args.start_date,
+                end_date=args.end_date,
+                product=args.product,
+                max_records_per_request=args.max_records_per_request,
+                history_path=args.run_history,
+                stats=stats
+            )
+            return 0
+        
+        if args.build_cube:
+            bbox = tuple(float(v) for v in args.cube_bbox.split(',')) if args.cube_bbox else None
+            build_local_cube(sorted(glob.glob(args.build_cube)), args.local_cube, bbox=bbox)
+        
         process_chirps_pipeline(
             shapefile_path=args.shapefile,
-            country_name=args.country_name,
+            country_name=country_name,
             admin_level=args.admin_level,
             admin_field=args.admin_field,
             admin_names=admin_names,
@@ -939,7 +3620,21 @@ Examples:
             early_first=args.early_first,
             early_last=args.early_last,
             late_first=args.late_first,
-            late_last=args.late_last
+            late_last=args.late_last,
+            product=args.product,
+            wet_day_threshold=args.wet_day_threshold,
+            cache=cache,
+            max_records_per_request=args.max_records_per_request,
+            local_cube=args.local_cube,
+            workers=args.workers,
+            history_path=args.run_history,
+            stats=stats,
+            points_path=args.points,
+            point_id_field=args.point_id_field,
+            bundle_dir=args.bundle_dir,
+            bundle_format=args.bundle_format,
+            array_dir=args.array_dir,
+            array_format=args.array_format
         )
     except Exception as e:
         print(f"\n❌ Error: {e}")